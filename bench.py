@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for SlidesBot.
+
+Runs SlidesBot.answer_question end to end against a local OpenAI-compatible mock server,
+so that the orchestration loop can be measured without an API key or network access.
+
+The mock server answers deterministically, according to who is asking:
+- Coordinator: asks questions about the top lectures of the ranked shortlist for a fixed
+  number of rounds (two questions to the first lecture, to exercise coalescing), then gives a final answer.
+- LectureBot: a canned answer, or a JSON "answers" array for coalesced questions.
+- Summarizer: a canned JSON summary.
+Latency and errors (429 with Retry-After, or 500) can be injected. Streamed requests are answered with
+server-sent events, and the time to the first piece of the final answer is reported.
+
+USAGE:
+    python bench.py run [--rounds 2] [--latency 0.2] [--jitter 0.1] [--error-rate 0.05] [--questions questions.jsonl] [--output report.json] [--stream]
+    python bench.py mock [--port 8200]  # Only start the mock server; point an LLM config file at it
+
+    The questions file has one JSON object per line with a "question" field.
+"""
+
+import json
+import re
+import time
+import random
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from typing import List, Dict, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bot
+
+
+DEFAULT_QUESTIONS = [
+    "What is the difference between a pointer and a reference?",
+    "What is undefined behavior? Give some examples from the course.",
+    "How do I pass a two-dimensional array to a function in C?",
+    "When should I use std::unique_ptr instead of std::shared_ptr?",
+    "What does the strong exception safety guarantee mean?",
+    "How does printf know how many arguments it receives?",
+    "Why is the copy-and-swap idiom exception safe?",
+    "What is the difference between std::vector and std::list?",
+]
+
+
+class MockStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = 0
+            self.coordinator_calls = 0
+            self.errors = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return {"llm_calls": self.calls, "iterations": self.coordinator_calls, "injected_errors": self.errors,
+                    "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens}
+
+
+class MockServer(ThreadingHTTPServer):
+    """An OpenAI-compatible chat completions server with scripted responses and injected latency/errors."""
+    daemon_threads = True
+
+    def __init__(self, address, rounds: int = 2, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        super().__init__(address, MockRequestHandler)
+        self.rounds = rounds
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.stats = MockStats()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def respond(self, request: dict) -> str:
+        messages = request["messages"]
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        last = messages[-1]["content"]
+        if "teaching assistant coordinator" in system:
+            with self.stats.lock:
+                self.stats.coordinator_calls += 1
+            rounds_done = sum(1 for m in messages if m["role"] == "assistant")
+            if rounds_done >= self.rounds or "Maximum iterations" in last:
+                return json.dumps({"action": "final_answer", "answer": f"Mock final answer after {rounds_done} rounds."})
+            shortlist = re.search(r"Ranked shortlist[^:]*: ([\d, ]+)", system)
+            lectures = [int(n) for n in shortlist[1].split(",")] if shortlist else [0]
+            first, second = lectures[0], lectures[1 % len(lectures)]
+            return json.dumps({"action": "ask_questions", "reasoning": f"Mock round {rounds_done + 1}.", "questions": [
+                {"lecture_number": first, "question": f"Round {rounds_done + 1}: what does the lecture say about the topic?"},
+                {"lecture_number": first, "question": f"Round {rounds_done + 1}: which examples does the lecture give?"},
+                {"lecture_number": second, "question": f"Round {rounds_done + 1}: how is the topic related to this lecture?"},
+            ]})
+        if "concise summaries" in system:
+            return json.dumps({"keywords": ["mock"], "brief": "Mock summary."})
+        if (coalesced := re.search(r'"answers" array holding exactly (\d+) strings', last)):
+            return json.dumps({"answers": [f"Mock answer {i + 1}." for i in range(int(coalesced[1]))]})
+        return "Mock answer based on the lecture content. " * 20
+
+    def delay_and_fault(self) -> Optional[int]:
+        """Sleeps for the injected latency. Returns an HTTP status to fail with, if any."""
+        with self.random_lock:
+            delay = max(0.0, self.random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+            fail = self.random.random() < self.error_rate
+            status = self.random.choice([429, 500]) if fail else None
+        time.sleep(delay)
+        return status
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    server: MockServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: dict, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            return self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        stats = self.server.stats
+        if (status := self.server.delay_and_fault()) is not None:
+            with stats.lock:
+                stats.errors += 1
+            headers = {"Retry-After": "0.1"} if status == 429 else None
+            return self._reply(status, {"error": {"message": "Injected error", "type": "mock", "code": status}}, headers)
+        content = self.server.respond(request)
+        prompt_tokens = sum(len(m["content"]) for m in request["messages"]) // 4
+        completion_tokens = len(content) // 4
+        with stats.lock:
+            stats.calls += 1
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+        if request.get("stream"):
+            return self._stream(request, content, prompt_tokens, completion_tokens)
+        self._reply(200, {
+            "id": f"mock-{stats.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def _stream(self, request: dict, content: str, prompt_tokens: int, completion_tokens: int):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        chunk = {"id": f"mock-{self.server.stats.calls}", "object": "chat.completion.chunk", "created": int(time.time()),
+                 "model": request["model"]}
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        for i, piece in enumerate(pieces):
+            delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+            finish_reason = "stop" if i == len(pieces) - 1 else None
+            self._event({**chunk, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]})
+            time.sleep(self.server.latency / 50)  # Generation is spread over the response
+        if request.get("stream_options", {}).get("include_usage"):
+            self._event({**chunk, "choices": [], "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                                          "total_tokens": prompt_tokens + completion_tokens}})
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def _event(self, data: dict):
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+
+def load_questions(path: Optional[str]) -> List[str]:
+    if path is None:
+        return DEFAULT_QUESTIONS
+    with open(path, 'r', encoding='utf-8') as file:
+        return [json.loads(line)["question"] for line in file if line.strip()]
+
+
+def run_benchmark(server: MockServer, questions: List[str], max_iterations: int, top_k: int, stream: bool = False) -> List[dict]:
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = Path(tmp) / "config.json"
+        config_path.write_text(json.dumps({"api_key": "mock", "base_url": server.base_url,
+                                           "basic_model": "mock-basic", "reasoner_model": "mock-reasoner"}))
+        bot.LLM.init_from_config_file(config_path)
+        # Work on a copy of summary.json, so that a benchmark never rewrites the real one.
+        summary_path = Path(tmp) / "summary.json"
+        summary_path.write_text((Path(bot.__file__).parent / "summary.json").read_text(encoding='utf-8'), encoding='utf-8')
+        slides_bot = bot.SlidesBot(summary_path=summary_path, readme_path=Path(bot.__file__).parent / "README.md")
+        slides_bot.internal_printer.enabled = False
+        slides_bot.preload()
+        bot.LLM.get_client()  # Imports openai, so that the first question does not pay for it
+        results = []
+        for question in questions:
+            server.stats.reset()
+            start = time.perf_counter()
+            first_text = []
+
+            def on_text(text):
+                # The time to the first piece of the answer kept: retracted text (None) does not count.
+                if text is None:
+                    first_text.clear()
+                elif not first_text:
+                    first_text.append(time.perf_counter() - start)
+            slides_bot.answer_question(question, max_iterations, top_k, on_text=on_text if stream else None)
+            wall_time = time.perf_counter() - start
+            results.append({"question": question, "wall_time": wall_time, "first_text": first_text[0] if first_text else wall_time,
+                            **server.stats.snapshot()})
+        return results
+
+
+def print_report(results: List[dict]):
+    columns = ["wall_time", "first_text", "iterations", "llm_calls", "prompt_tokens", "completion_tokens", "injected_errors"]
+    print(f"{'#':>3}  " + "  ".join(f"{c:>17}" for c in columns))
+    for i, r in enumerate(results):
+        print(f"{i:>3}  " + "  ".join(f"{r[c]:>17.3f}" if c in ("wall_time", "first_text") else f"{r[c]:>17}" for c in columns))
+    n = len(results)
+    print(f"{'avg':>3}  " + "  ".join(f"{sum(r[c] for r in results) / n:>17.3f}" for c in columns))
+    wall_times = sorted(r["wall_time"] for r in results)
+    print(f"\nwall time p50 = {wall_times[n // 2]:.3f}s, max = {wall_times[-1]:.3f}s, total = {sum(wall_times):.3f}s")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Offline benchmark for SlidesBot")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name in ("run", "mock"):
+        sub = subparsers.add_parser(name)
+        sub.add_argument('--port', type=int, default=0 if name == "run" else 8200, help='Port of the mock server')
+        sub.add_argument('--rounds', type=int, default=2, help='Rounds of questions the mock coordinator asks before answering (default: 2)')
+        sub.add_argument('--latency', type=float, default=0.0, help='Mean latency of each mock response in seconds (default: 0)')
+        sub.add_argument('--jitter', type=float, default=0.0, help='Standard deviation of the latency in seconds (default: 0)')
+        sub.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with 429 or 500 (default: 0)')
+        sub.add_argument('--seed', type=int, default=0, help='Seed for latency and error injection (default: 0)')
+        if name == "run":
+            sub.add_argument('--questions', type=str, help='JSONL file of questions (default: a built-in set)')
+            sub.add_argument('--max-iterations', type=int, default=8, help='Passed to answer_question (default: 8)')
+            sub.add_argument('--top-k', type=int, default=6, help='Passed to answer_question (default: 6)')
+            sub.add_argument('--output', type=str, help='Also write the per-question results to this JSON file')
+            sub.add_argument('--stream', action='store_true', help='Stream the final answers and report the time to their first piece')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    server = MockServer(("127.0.0.1", args.port), rounds=args.rounds, latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate, seed=args.seed)
+    if args.command == "mock":
+        print(f"Mock server listening on {server.base_url}. Press Ctrl+C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        results = run_benchmark(server, load_questions(args.questions), args.max_iterations, args.top_k, args.stream)
+    finally:
+        server.shutdown()
+        server.server_close()
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
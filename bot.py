@@ -20,6 +20,7 @@ multiple AI agents working collaboratively:
    
    a) Coordinator Agent (SlidesBot):
       - Analyzes student questions to identify required information
+      - Sees full summaries only for lectures shortlisted by a local BM25 index
       - Strategically selects relevant lectures to query
       - Formulates specific questions for specialist agents
       - Synthesizes responses from multiple sources
@@ -28,7 +29,9 @@ multiple AI agents working collaboratively:
    b) Specialist Agents (LectureBots):
       - Each agent is an expert on exactly one lecture's content
       - Answers questions based STRICTLY on their assigned lecture
-      - Uses low temperature (0.3) and reasoning models for accuracy
+      - Reads only the slides relevant to each question, or the whole lecture when unsure
+      - Uses low temperature (0.3); by default answers with the basic model first and re-asks the
+        reasoning model when the answer is low confidence or says the topic is not covered
       - Prevented from using external knowledge to ensure course alignment
 
 3. ITERATIVE REASONING PROCESS:
@@ -43,12 +46,14 @@ multiple AI agents working collaboratively:
    - Context-aware: Understands course progression and concept dependencies  
    - Iterative refinement: Can ask follow-up questions based on initial answers
    - Intelligent synthesis: Combines information from multiple sources meaningfully
-   - No embedding/vector similarity required: Uses structured summaries and AI reasoning
+   - No embedding model required: Retrieval uses structured summaries and AI reasoning; the only vector
+     similarity is a local n-gram match that reuses final answers of near-identical earlier questions
 
 USAGE:
     python bot.py -c my_llm_config.json --question "How do I pass arrays to functions in C?"
     python bot.py --max-iterations 10 --question "Explain object-oriented programming concepts"
-    python bot.py  # Interactive mode (not yet implemented)
+    python bot.py --serve --port 8100  # Keep the bot warm and serve questions over HTTP
+    python bot.py  # Interactive mode
 
     Refer to LLM.init_from_config_file for config file format.
 
@@ -57,57 +62,467 @@ systems, agentic RAG, and iterative reasoning to provide accurate, course-aligne
 """
 
 import sys
-from openai import OpenAI
 import json
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Callable, Iterator, TYPE_CHECKING
 import os
 import re
 import argparse
+import asyncio
+import math
+import hashlib
+import importlib.util
+import mmap
+import zlib
+import textwrap
+import sqlite3
+import threading
+import queue
+import time
+import random
+import uuid
+import contextvars
+from contextlib import contextmanager
+from collections import Counter, deque
+from types import SimpleNamespace
+import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+if TYPE_CHECKING:
+    # openai takes most of the startup time, so it is only imported when the first request is sent (see LLM.get_client).
+    import openai
+    from openai import AsyncOpenAI
 
 
 def parse_arguments():
     """
-    bot.py [-c|--config-llm <config_file_path>] [--max-iterations N] [-q|--question "Your question here"]
+    bot.py [-c|--config-llm <config_file_path>] [--max-iterations N] [--top-k K]
+           [--answer-cache <path> | --no-answer-cache] [--snapshot <path> | --no-snapshot] [--max-in-flight N]
+           [--request-timeout SECONDS] [--hedge] [--specialist-tier T] [--coordinator-tier T] [--summary-tier T]
+           [--time-budget SECONDS] [--context-budget TOKENS] [--compaction MODE]
+           [--speculative [--speculative-lectures N] [--speculative-budget N]]
+           [--similar-cache <path> | --no-similar-cache] [--similar-threshold T] [--quiet] [--no-stream]
+           [--trace-file <path>] [--report]
+           [-q|--question "Your question here" | --serve [--host HOST] [--port PORT]
+            | --batch <questions.jsonl> --batch-output <answers.jsonl> [--batch-concurrency N]]
     If --config-llm is provided, initializes LLM from the specified config file.
     If --max-iterations is not provided, defaults to 8.
-    If --question is not provided, enters interactive mode.
+    If --top-k is not provided, defaults to 6.
+    Answers of LectureBots are cached in --answer-cache unless --no-answer-cache is given.
+    Startup loads the lectures and their summaries from --snapshot, rebuilt when they change, unless --no-snapshot is given.
+    If --max-in-flight is not provided, defaults to 16.
+    If --request-timeout is not provided, defaults to 120 seconds.
+    --specialist-tier, --coordinator-tier and --summary-tier choose the models of LectureBots, of the coordinator and of
+    lecture summaries: 'basic', 'reasoner', or 'adaptive' (basic_model first, escalating to reasoner_model when its output
+    fails a check). They default to adaptive, reasoner and basic respectively.
+    If --time-budget is not provided, there is no overall time limit.
+    If --context-budget is not provided, defaults to 16000 tokens. 0 disables compaction of the coordinator's messages.
+    If --compaction is not provided, defaults to 'extractive'. 'llm' condenses earlier rounds with one basic_model call.
+    If --speculative is provided, the top --speculative-lectures (default: 2) lectures are asked the student's question
+    while the coordinator makes its first decision, for at most --speculative-budget (default: 500) calls per process.
+    The answers of the lectures the coordinator picks are added to its own; those lectures still get its questions.
+    Final answers are kept in --similar-cache (requires NumPy) unless --no-similar-cache is given. A question at least
+    --similar-threshold (default: 0.9) similar to an earlier one, with the same words, gets its answer directly
+    (see SimilarQuestionCache).
+    The final answer is printed as it is generated, unless --no-stream is given.
+    If --trace-file is provided, every span (LLM call, coordinator iteration, ...) is appended to it as a JSON line.
+    If --report is provided, prints the token and latency report of the question after the final answer, with the
+    cache and speculation counters (see SlidesBot.stats).
+    If --question is provided, answers it and exits.
+    If --serve is provided, keeps the bot warm and serves questions over HTTP (see SlidesServer).
+    If --batch is provided, answers every question in the file (see run_batch), at most --batch-concurrency
+    (default: 8) at a time, and appends the answers to --batch-output. Rerunning resumes where it stopped.
+    Otherwise, enters interactive mode.
     """
     parser = argparse.ArgumentParser(description="SlidesBot Command Line Interface")
     parser.add_argument('-c', '--config-llm', type=str, help='Path to LLM configuration JSON file')
     parser.add_argument('--max-iterations', type=int, default=8, help='Maximum iterations for the bot to reach a final answer (default: 8)')
     parser.add_argument('-q', '--question', type=str, help='The question to ask the SlidesBot. If not provided, enters interactive mode.')
+    parser.add_argument('--top-k', type=int, default=6, help='Number of locally ranked lectures whose full summaries are shown to the coordinator (default: 6)')
+    parser.add_argument('--answer-cache', type=str, default=str(Path(__file__).parent / ".cache" / "answers.sqlite"), help='Path to the SQLite cache of lecture answers (default: .cache/answers.sqlite)')
+    parser.add_argument('--no-answer-cache', action='store_true', help='Disable the cache of lecture answers')
+    parser.add_argument('--snapshot', type=str, default=str(Path(__file__).parent / ".cache" / "snapshot.bin"), help='Path to the startup snapshot of lectures and summaries (default: .cache/snapshot.bin)')
+    parser.add_argument('--no-snapshot', action='store_true', help='Check every lecture at startup instead of loading the snapshot')
+    parser.add_argument('--max-in-flight', type=int, default=16, help='Maximum number of LLM requests in flight across the whole process (default: 16)')
+    parser.add_argument('--request-timeout', type=float, default=120.0, help='Deadline in seconds for each attempt of an LLM request (default: 120)')
+    parser.add_argument('--hedge', action='store_true', help='Send a duplicate LLM request when one runs past the observed p95 latency')
+    for role, default in LLM.tiers.items():
+        parser.add_argument(f'--{role}-tier', choices=['basic', 'reasoner', 'adaptive'], default=default, help=f'Models used for the {role} (default: {default})')
+    parser.add_argument('--time-budget', type=float, help='Seconds to spend gathering information before forcing a final answer (default: unlimited)')
+    parser.add_argument('--context-budget', type=int, default=16000, help='Estimated tokens of coordinator messages above which earlier rounds are condensed (default: 16000, 0 to disable)')
+    parser.add_argument('--compaction', choices=['extractive', 'llm'], default='extractive', help='How earlier rounds are condensed (default: extractive)')
+    parser.add_argument('--speculative', action='store_true', help="Ask likely lectures the student's question while the coordinator makes its first decision")
+    parser.add_argument('--speculative-lectures', type=int, default=2, help='Lectures asked speculatively per question (default: 2)')
+    parser.add_argument('--speculative-budget', type=int, default=500, help='Maximum speculative calls per process (default: 500)')
+    parser.add_argument('--similar-cache', type=str, default=str(Path(__file__).parent / ".cache" / "similar_answers.json"), help='Path to the cache of final answers looked up by question similarity (default: .cache/similar_answers.json)')
+    parser.add_argument('--no-similar-cache', action='store_true', help='Disable the cache of final answers')
+    parser.add_argument('--similar-threshold', type=float, default=0.9, help='Similarity above which a cached final answer is returned (default: 0.9)')
+    parser.add_argument('--quiet', action='store_true', help='Do not print the internal steps')
+    parser.add_argument('--no-stream', action='store_true', help='Print the final answer only once it is complete')
+    parser.add_argument('--trace-file', type=str, help='Append spans to this JSON-lines file')
+    parser.add_argument('--report', action='store_true', help='Print the token and latency report of the question')
+    parser.add_argument('--serve', action='store_true', help='Serve questions over HTTP instead of answering a single question')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Host for --serve (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8100, help='Port for --serve (default: 8100)')
+    parser.add_argument('--batch', type=str, help='JSONL file of questions to answer, one {"id": ..., "question": ...} per line')
+    parser.add_argument('--batch-output', type=str, help='JSONL file the answers of --batch are appended to; also used to resume')
+    parser.add_argument('--batch-concurrency', type=int, default=8, help='Questions of --batch answered at a time (default: 8)')
     return parser.parse_args()
 
 
+class Scheduler:
+    """
+    A process-wide event loop running on a background thread. All LLM requests are sent from it,
+    and at most max_in_flight of them are in flight at any time, no matter how many questions
+    are being answered concurrently or from which threads and event loops.
+    """
+    max_in_flight: int = 16
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _thread: Optional[threading.Thread] = None
+    _semaphore: Optional[asyncio.Semaphore] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def loop(cls) -> asyncio.AbstractEventLoop:
+        with cls._lock:
+            if cls._loop is None:
+                cls._loop = asyncio.new_event_loop()
+                cls._thread = threading.Thread(target=cls._loop.run_forever, name="Scheduler", daemon=True)
+                cls._thread.start()
+            return cls._loop
+
+    @classmethod
+    def run(cls, coro):
+        """Runs a coroutine on the scheduler loop and blocks until it finishes. Must not be called from the loop itself."""
+        return cls.start(coro).result()
+
+    @classmethod
+    def start(cls, coro) -> concurrent.futures.Future:
+        """Starts a coroutine on the scheduler loop without waiting for it. Must not be called from the loop itself."""
+        loop = cls.loop()
+        if threading.current_thread() is cls._thread:
+            raise RuntimeError("Blocking call on the scheduler loop. Use the async API instead.")
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    @classmethod
+    async def submit(cls, coro):
+        """Awaits a coroutine on the scheduler loop, from whatever event loop the caller is running in."""
+        loop = cls.loop()
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    @classmethod
+    def slot(cls) -> asyncio.Semaphore:
+        # Only used on the scheduler loop, so no lock is needed.
+        if cls._semaphore is None:
+            cls._semaphore = asyncio.Semaphore(cls.max_in_flight)
+        return cls._semaphore
+
+
+class QuestionReport:
+    """Aggregates the spans finished while it is being collected (see Tracer.collect)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.wall_time = 0.0
+        self.counts: Counter = Counter()  # Spans by name
+        self.errors = 0
+        self.llm_time = 0.0
+        self.by_model: Dict[str, Counter] = {}
+
+    def add(self, span: dict):
+        with self.lock:
+            self.counts[span["name"]] += 1
+            self.errors += "error" in span
+            if span["name"] == "llm":
+                self.llm_time += span["duration"]
+                usage = self.by_model.setdefault(span["attributes"]["model"], Counter())
+                usage["calls"] += 1
+                for key in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+                    usage[key] += span["attributes"].get(key, 0)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            totals = sum(self.by_model.values(), Counter())
+            return {
+                "wall_time": self.wall_time,
+                "iterations": self.counts["coordinator_iteration"],
+                "llm_calls": totals["calls"],
+                "llm_time": self.llm_time,
+                "prompt_tokens": totals["prompt_tokens"],
+                "completion_tokens": totals["completion_tokens"],
+                "cached_tokens": totals["cached_tokens"],
+                "errors": self.errors,
+                "spans": dict(self.counts),
+                "by_model": {model: dict(usage) for model, usage in self.by_model.items()},
+            }
+
+
+class JsonlExporter:
+    """A Tracer sink appending every finished span to a JSON-lines file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, span: dict):
+        line = json.dumps(span, ensure_ascii=False, default=str)
+        with self.lock, open(self.path, 'a', encoding='utf-8') as file:
+            file.write(line + "\n")
+
+
+class Tracer:
+    """
+    Records spans for LLM calls, coordinator iterations, specialist fan-outs and summarization jobs.
+    Finished spans are passed to every sink, and to the QuestionReports being collected.
+    The current span and reports live in context variables, so they follow tasks and the hop to the scheduler loop.
+    """
+    sinks: List[Callable[[dict], None]] = []
+    _current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+    _reports: contextvars.ContextVar = contextvars.ContextVar("reports", default=())
+
+    @staticmethod
+    @contextmanager
+    def span(name: str, **attributes):
+        """Yields the span; attributes may be added to span["attributes"] until it finishes."""
+        parent = Tracer._current_span.get()
+        span = {
+            "name": name,
+            "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent["span_id"] if parent else None,
+            "start": time.time(),
+            "attributes": attributes,
+        }
+        token = Tracer._current_span.set(span)
+        start = time.monotonic()
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = repr(e)
+            raise
+        finally:
+            span["duration"] = time.monotonic() - start
+            Tracer._current_span.reset(token)
+            for report in Tracer._reports.get():
+                report.add(span)
+            for sink in Tracer.sinks:
+                sink(span)
+
+    @staticmethod
+    @contextmanager
+    def collect():
+        """Yields a QuestionReport aggregating the spans finished within this context."""
+        report = QuestionReport()
+        token = Tracer._reports.set(Tracer._reports.get() + (report,))
+        try:
+            yield report
+        finally:
+            report.wall_time = time.monotonic() - report.start
+            Tracer._reports.reset(token)
+
+
 class LLM:
-    client: OpenAI
+    client: Optional["AsyncOpenAI"] = None  # Created by get_client, from client_args
+    client_args: dict = {}
+    _client_lock = threading.Lock()
     basic_model: str
     reasoner_model: Optional[str]
 
+    # Request policy. Retries are done here, so the client is created with max_retries=0.
+    timeout: float = 120.0  # Deadline of each attempt, in seconds
+    max_retries: int = 4
+    backoff_base: float = 1.0
+    backoff_max: float = 30.0
+    hedge: bool = False  # Send a duplicate request when an attempt runs past the p95 latency of its model
+    hedge_min_samples: int = 20
+    latencies: Dict[str, deque] = {}  # Recent successful latencies per model
+
+    # Model tier of each role: "basic", "reasoner", or "adaptive", which tries basic_model first
+    # and escalates to reasoner_model when the output fails the checks of its role.
+    tiers: Dict[str, str] = {"specialist": "adaptive", "coordinator": "reasoner", "summary": "basic"}
+
     def __init__(self, always_reason: bool = False):
         self.always_reason = always_reason
         if not self.reasoner_model:
             print("Warning: reasoner_model not set. Will fall back to basic_model for reasoning.", file=sys.stderr)
 
-    def invoke(self, messages: List[Dict[str, str]], **more_args) -> str:
+    def invoke(self, messages: List[Dict[str, str]], deadline: Optional[float] = None, **more_args) -> str:
+        return Scheduler.run(self.ainvoke(messages, deadline, **more_args))
+
+    async def ainvoke(self, messages: List[Dict[str, str]], deadline: Optional[float] = None, **more_args) -> str:
+        """deadline, if given, is a time.monotonic() value after which no more attempts are made."""
+        more_args["stream"] = False
+        return await Scheduler.submit(LLM._request(self._args(messages, more_args), deadline))
+
+    async def astream(self, messages: List[Dict[str, str]], on_text: Callable[[str], None], deadline: Optional[float] = None,
+                      on_restart: Optional[Callable[[], None]] = None, **more_args) -> str:
+        """
+        Like ainvoke, but streams the response: on_text is called on the scheduler loop with each piece of content
+        as it arrives, and the whole content is returned. A stream that breaks after content has arrived is only
+        retried if on_restart is given; it is called first, to take back the content passed on so far.
+        """
+        more_args["stream"] = True
+        more_args["stream_options"] = {"include_usage": True}
+        return await Scheduler.submit(LLM._request(self._args(messages, more_args), deadline, on_text, on_restart))
+
+    def _args(self, messages: List[Dict[str, str]], more_args: dict) -> dict:
         if "model" not in more_args:
             more_args["model"] = LLM.reasoner_model if self.always_reason else LLM.basic_model
         if not more_args["model"]:
             more_args["model"] = LLM.basic_model
         more_args["messages"] = messages
-        more_args["stream"] = False
-        return LLM.client.chat.completions.create(**more_args).choices[0].message.content
+        return more_args
+
+    @staticmethod
+    async def _request(args: dict, deadline: Optional[float], on_text: Optional[Callable[[str], None]] = None,
+                       on_restart: Optional[Callable[[], None]] = None) -> str:
+        with Tracer.span("llm", model=args["model"], stream=args["stream"]) as span:
+            response = await LLM._retrying(args, deadline, span, on_text, on_restart)
+            if (usage := response.usage) is not None:
+                span["attributes"]["prompt_tokens"] = usage.prompt_tokens
+                span["attributes"]["completion_tokens"] = usage.completion_tokens
+                span["attributes"]["cached_tokens"] = LLM._cached_tokens(usage)
+            return response.choices[0].message.content
+
+    @staticmethod
+    def get_client() -> "AsyncOpenAI":
+        with LLM._client_lock:
+            if LLM.client is None:
+                from openai import AsyncOpenAI
+                LLM.client = AsyncOpenAI(**LLM.client_args, max_retries=0)
+            return LLM.client
+
+    @staticmethod
+    def warm_up():
+        """Imports openai and creates the client on a background thread, e.g. while waiting for the first question."""
+        threading.Thread(target=LLM.get_client, name="LLM warm-up", daemon=True).start()
+
+    @staticmethod
+    def tier_models(role: str) -> List[str]:
+        """The models to try for a role, cheapest first."""
+        reasoner = LLM.reasoner_model or LLM.basic_model
+        return {"basic": [LLM.basic_model], "reasoner": [reasoner],
+                "adaptive": list(dict.fromkeys([LLM.basic_model, reasoner]))}[LLM.tiers[role]]
+
+    @staticmethod
+    def _cached_tokens(usage) -> int:
+        # OpenAI reports prompt_tokens_details.cached_tokens; DeepSeek reports prompt_cache_hit_tokens.
+        if (details := getattr(usage, "prompt_tokens_details", None)) is not None and details.cached_tokens:
+            return details.cached_tokens
+        return getattr(usage, "prompt_cache_hit_tokens", None) or 0
+
+    @staticmethod
+    async def _retrying(args: dict, deadline: Optional[float], span: dict, on_text: Optional[Callable[[str], None]] = None,
+                        on_restart: Optional[Callable[[], None]] = None):
+        import openai
+        for attempt in range(LLM.max_retries + 1):
+            span["attributes"]["attempts"] = attempt + 1
+            timeout = LLM.timeout if deadline is None else min(LLM.timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                raise TimeoutError("Deadline exceeded before the LLM request could be sent.")
+            try:
+                if on_text is not None:
+                    return await asyncio.wait_for(LLM._attempt(args, span, on_text), timeout)
+                return await asyncio.wait_for(LLM._hedged(args, span), timeout)
+            except openai.RateLimitError as e:
+                error, delay = e, LLM._retry_after(e) or LLM._backoff(attempt)
+            except (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError, asyncio.TimeoutError) as e:
+                error, delay = e, LLM._backoff(attempt)
+            except openai.APIError as e:
+                if "first_token" not in span["attributes"]:
+                    raise
+                error, delay = e, LLM._backoff(attempt)  # A stream broken off by an error event
+            # Content already passed to on_text can only be taken back by on_restart; without it, a broken stream is not retried.
+            if attempt == LLM.max_retries or ("first_token" in span["attributes"] and on_restart is None) or \
+                    (deadline is not None and time.monotonic() + delay >= deadline):
+                raise error
+            if span["attributes"].pop("first_token", None) is not None:
+                on_restart()
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        # Exponential backoff with full jitter.
+        return random.uniform(0, min(LLM.backoff_max, LLM.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _retry_after(error: "openai.APIStatusError") -> Optional[float]:
+        headers = error.response.headers
+        try:
+            if (ms := headers.get("retry-after-ms")) is not None:
+                return float(ms) / 1000
+            if (seconds := headers.get("retry-after")) is not None:
+                return float(seconds)
+        except ValueError:
+            pass
+        return None
+
+    @staticmethod
+    def _p95(model: str) -> Optional[float]:
+        samples = LLM.latencies.get(model)
+        if not samples or len(samples) < LLM.hedge_min_samples:
+            return None
+        return sorted(samples)[int(0.95 * (len(samples) - 1))]
+
+    @staticmethod
+    async def _hedged(args: dict, span: dict):
+        first = asyncio.ensure_future(LLM._attempt(args))
+        if not LLM.hedge or (threshold := LLM._p95(args["model"])) is None:
+            return await first
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=threshold)
+            if not done:
+                span["attributes"]["hedged"] = True
+                tasks.add(asyncio.ensure_future(LLM._attempt(args)))
+            # The first successful attempt wins; the other one is cancelled.
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            return first.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    async def _attempt(args: dict, span: Optional[dict] = None, on_text: Optional[Callable[[str], None]] = None):
+        async with Scheduler.slot():
+            start = time.monotonic()
+            response = await LLM.get_client().chat.completions.create(**args)
+            if on_text is not None:
+                response = await LLM._consume(response, span, on_text, start)
+            LLM.latencies.setdefault(args["model"], deque(maxlen=200)).append(time.monotonic() - start)
+        return response
+
+    @staticmethod
+    async def _consume(stream, span: dict, on_text: Callable[[str], None], start: float):
+        """Reads a streamed response, passing its content to on_text. Returns an object shaped like a non-streamed response."""
+        content, usage = [], None
+        async for chunk in stream:
+            usage = chunk.usage or usage
+            if chunk.choices and (delta := chunk.choices[0].delta.content):
+                if not content:
+                    span["attributes"]["first_token"] = time.monotonic() - start
+                content.append(delta)
+                on_text(delta)
+        message = SimpleNamespace(content="".join(content))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
 
     @staticmethod
     def init_gkxx_deepseek():
         """GKxx's personal DeepSeek configuration"""
         os.environ["all_proxy"] = os.environ["ALL_PROXY"] = ""
         try:
-            LLM.client = OpenAI(api_key=os.environ["DS_APIKey_GKxxPersonal"], base_url="https://api.deepseek.com")
+            LLM.client_args = dict(api_key=os.environ["DS_APIKey_GKxxPersonal"], base_url="https://api.deepseek.com")
         except KeyError:
             raise RuntimeError("Environment variable DS_APIKey_GKxxPersonal not set. If you are not GKxx, please use --config-llm to provide your own configuration file.")
+        LLM.client = None
         LLM.basic_model = "deepseek-chat"
         LLM.reasoner_model = "deepseek-reasoner"
 
@@ -117,12 +532,19 @@ class LLM:
         with open(config_file_path, 'r') as f:
             config = json.load(f)
         os.environ["all_proxy"] = os.environ["ALL_PROXY"] = ""
-        LLM.client = OpenAI(api_key=config["api_key"], base_url=config["base_url"])
+        LLM.client_args = dict(api_key=config["api_key"], base_url=config["base_url"])
+        LLM.client = None
         LLM.basic_model = config["basic_model"]
         LLM.reasoner_model = config.get("reasoner_model", None)
 
 
 class LecturesMetadata:
+    # Lecture directories are looked up once per process (or taken from the Snapshot).
+    main_files: Dict[int, Path] = {}
+    images: Dict[int, bool] = {}
+    source_hashes: Dict[int, Tuple[int, int, str]] = {}  # (mtime_ns, size, hash) of each main file
+    notes_hashes: Dict[int, Tuple[int, int, str]] = {}  # (mtime_ns, size, hash) of each notes file
+
     @staticmethod
     def is_valid_lecture_number(lec_no: int) -> bool:
         return 0 <= lec_no <= 28
@@ -151,11 +573,19 @@ class LecturesMetadata:
 
     @staticmethod
     def contains_images(lec_no: int) -> bool:
-        lec_dir = LecturesMetadata.get_lecture_dir(lec_no)
-        return (lec_dir / "img").exists() or (lec_dir / "image").exists()
+        if lec_no not in LecturesMetadata.images:
+            lec_dir = LecturesMetadata.get_lecture_dir(lec_no)
+            LecturesMetadata.images[lec_no] = (lec_dir / "img").exists() or (lec_dir / "image").exists()
+        return LecturesMetadata.images[lec_no]
 
     @staticmethod
     def get_lecture_main_file(lec_no: int) -> Path:
+        if lec_no not in LecturesMetadata.main_files:
+            LecturesMetadata.main_files[lec_no] = LecturesMetadata._find_main_file(lec_no)
+        return LecturesMetadata.main_files[lec_no]
+
+    @staticmethod
+    def _find_main_file(lec_no: int) -> Path:
         lec_dir = LecturesMetadata.get_lecture_dir(lec_no)
         if md_files := list(lec_dir.glob("*.md")):
             assert len(md_files) == 1, f"Multiple .md files found in {lec_dir}"
@@ -165,6 +595,98 @@ class LecturesMetadata:
             return tex_files[0]
         raise FileNotFoundError(f"No .md or .tex files found in {lec_dir}")
 
+    @staticmethod
+    def content_hash(content: str) -> str:
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get_source_hash(lec_no: int) -> str:
+        """The hash of the main file, computed again only when its size or mtime changes."""
+        return LecturesMetadata._file_hash(LecturesMetadata.get_lecture_main_file(lec_no), LecturesMetadata.source_hashes, lec_no)
+
+    @staticmethod
+    def get_lecture_hash(lec_no: int) -> str:
+        """The hash of everything answers about the lecture depend on: the main file and the notes, if any."""
+        source_hash = LecturesMetadata.get_source_hash(lec_no)
+        try:
+            notes_hash = LecturesMetadata._file_hash(LecturesMetadata.get_lecture_dir(lec_no) / "notes.txt",
+                                                     LecturesMetadata.notes_hashes, lec_no)
+        except FileNotFoundError:
+            return source_hash
+        return LecturesMetadata.content_hash(source_hash + notes_hash)
+
+    @staticmethod
+    def _file_hash(path: Path, cache: Dict[int, Tuple[int, int, str]], lec_no: int) -> str:
+        stat = path.stat()
+        cached = cache.get(lec_no)
+        if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+            with open(path, 'r', encoding='utf-8') as file:
+                cached = (stat.st_mtime_ns, stat.st_size, LecturesMetadata.content_hash(file.read()))
+            cache[lec_no] = cached
+        return cached[2]
+
+
+class BM25:
+    """Okapi BM25 over pre-tokenized documents."""
+    STOPWORDS = frozenset("a an and are as at be by can do does for from how i in is it of on or the this to what when which why with".split())
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(doc) for doc in documents]
+        self.doc_lengths = [len(doc) for doc in documents]
+        self.avg_length = sum(self.doc_lengths) / len(documents) if documents else 0.0
+        doc_freqs = Counter(term for tf in self.term_freqs for term in tf)
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def to_dict(self) -> dict:
+        return {"k1": self.k1, "b": self.b, "term_freqs": self.term_freqs, "doc_lengths": self.doc_lengths, "idf": self.idf}
+
+    @staticmethod
+    def from_dict(state: dict) -> "BM25":
+        """Restores an index saved with to_dict, without tokenizing the documents again."""
+        index = BM25([], state["k1"], state["b"])
+        index.term_freqs = state["term_freqs"]
+        index.doc_lengths = state["doc_lengths"]
+        index.avg_length = sum(index.doc_lengths) / len(index.doc_lengths) if index.doc_lengths else 0.0
+        index.idf = state["idf"]
+        return index
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        # Identifiers and numbers as words; CJK characters one by one, since questions may be in Chinese.
+        return [t for t in re.findall(r"[a-z_][a-z0-9_]*|\d+|[\u4e00-\u9fff]", text.lower()) if t not in BM25.STOPWORDS]
+
+    def scores(self, query: List[str]) -> List[float]:
+        result = []
+        for tf, length in zip(self.term_freqs, self.doc_lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            for term in set(query):
+                if (f := tf.get(term)):
+                    score += self.idf[term] * f * (self.k1 + 1) / (f + norm)
+            result.append(score)
+        return result
+
+
+class LectureRouter:
+    """Ranks lectures for a question with a local BM25 index over the given texts, by default the compact lecture texts."""
+
+    def __init__(self, lecture_numbers: List[int], texts: Optional[List[str]] = None, index: Optional[BM25] = None):
+        self.lecture_numbers = list(lecture_numbers)
+        if index is not None:
+            self.index = index
+            return
+        if texts is None:
+            texts = [LectureCorpus.text(LectureCorpus.load(lec_no)[1]) for lec_no in self.lecture_numbers]
+        self.index = BM25([BM25.tokenize(text) for text in texts])
+
+    def rank(self, question: str) -> List[int]:
+        scores = self.index.scores(BM25.tokenize(question))
+        order = sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+        return [self.lecture_numbers[i] for i in order]
+
 
 class Initializer:
     def __init__(self, readme_path: Path, summary_path: Path):
@@ -172,16 +694,27 @@ class Initializer:
         self.summary_path = summary_path
         self.summary = self._load_summary()
         self.titles = self._load_titles()
+        self.source_hashes = {i: LecturesMetadata.get_source_hash(i) for i in range(len(self.titles))}
+        self.failures: Counter = Counter()
         self.remaining = self._get_remaining_lectures()
 
-    def work(self, max_workers: int = 4):
+    def work(self, max_workers: int = 4, max_rounds: int = 3):
         while self.remaining:
             self._summarize_all(workers=max_workers)
-            self.remaining = self._get_remaining_lectures()
-        print("All lectures summarized.")
+            self.remaining = [i for i in self._get_remaining_lectures() if self.failures[i] < max_rounds]
+        if missing := [i for i in self._get_remaining_lectures() if not self._is_complete(self.summary.get(str(i), {}))]:
+            raise RuntimeError(f"Failed to summarize lectures {missing} after {max_rounds} rounds.")
+        if outdated := self._get_remaining_lectures():
+            print(f"Warning: failed to update the summaries of lectures {outdated}. Using the outdated ones.", file=sys.stderr)
+        else:
+            print("All lectures summarized.")
 
     def _get_remaining_lectures(self) -> List[int]:
-        return [i for i in range(len(self.titles)) if str(i) not in self.summary or not self._is_complete(self.summary[str(i)])]
+        # A summary is rebuilt if it is missing, incomplete, or made from an older version of the lecture.
+        return [i for i in range(len(self.titles))
+                if str(i) not in self.summary
+                or not self._is_complete(self.summary[str(i)])
+                or self.summary[str(i)].get("source_hash") != self.source_hashes[i]]
 
     @staticmethod
     def _is_complete(lec_info: dict) -> bool:
@@ -198,8 +731,11 @@ class Initializer:
             return {}
 
     def _save_summary(self):
-        with open(self.summary_path, 'w') as file:
+        # Write to a temporary file first so that an interrupted checkpoint never corrupts summary.json.
+        tmp_path = self.summary_path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as file:
             json.dump(self.summary, file, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.summary_path)
 
     def _load_titles(self) -> List[str]:
         with open(self.readme_path, 'r', encoding='utf-8') as file:
@@ -207,11 +743,12 @@ class Initializer:
         return list(map(lambda m: m[1], re.findall(r"- Lecture (\d+): (.+)", content)))
 
     @staticmethod
-    def _summarize_lecture(lec_no: int, max_attempts: int) -> str:
+    def _summarize_lecture(lec_no: int, max_attempts: int) -> Tuple[dict, str]:
+        """Returns the summary and the model that made it."""
         Lec = LecturesMetadata
 
-        with open(Lec.get_lecture_main_file(lec_no), 'r', encoding='utf-8') as file:
-            content = file.read()
+        slides = LectureCorpus.load(lec_no)[1]
+        content = LectureCorpus.text(slides, labels=LectureCorpus.labels(lec_no, len(slides)))
 
         system_prompt = """You are an expert assistant that creates concise summaries of programming course lecture slides. Your task is to extract the key concepts, topics, and learning objectives from lecture content and present them in a structured JSON format.
 
@@ -241,54 +778,687 @@ class Initializer:
         Lecture content:
 
         {content}"""
-        for _ in range(max_attempts):
-            try:
-                return json.loads(LLM().invoke(
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    response_format={"type": "json_object"}))
-            except:
-                pass
-        raise RuntimeError(f"Failed to summarize lecture {lec_no} after {max_attempts} attempts.")
+        models = LLM.tier_models("summary")
+        with Tracer.span("summarize", lecture=lec_no) as span:
+            for attempt in range(max_attempts):
+                # A malformed summary is retried with the next model of the tier, if any.
+                model = models[min(attempt, len(models) - 1)]
+                span["attributes"]["model"] = model
+                try:
+                    res = json.loads(LLM().invoke(
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        model=model,
+                        response_format={"type": "json_object"}))
+                    if isinstance(res, dict) and res.get("keywords") and res.get("brief"):
+                        return res, model
+                except json.JSONDecodeError:
+                    pass  # Request errors are already retried by LLM; only retry malformed output here.
+            raise RuntimeError(f"Failed to summarize lecture {lec_no} after {max_attempts} attempts.")
 
     def _summarize_all(self, workers: int = 4):
-        results = {i: None for i in self.remaining}
+        # Each summary is checkpointed as soon as it is ready.
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._summarize_lecture, i, 3): i for i in self.remaining}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    res, model = future.result()
+                except Exception as e:
+                    print(f"Lecture {i} summarization failed: {e}")
+                    self.failures[i] += 1
+                    continue
+                self.summary[str(i)] = {
+                    "title": self.titles[i],
+                    "keywords": res["keywords"],
+                    "brief": res["brief"],
+                    "source_hash": self.source_hashes[i],
+                    "model": model
+                }
+                self._save_summary()
+
+
+class SlideChunker:
+    """
+    Splits a lecture main file into slides. The i-th Marp slide is page i + 1; beamer frames may span several
+    pages (see LectureCorpus.labels).
+    """
+    # A code fence line: a backtick run with at most a language tag, possibly opening a list item.
+    # Inline code such as ```while (cond) body``` is not a fence.
+    FENCE = re.compile(r"(- )?`{3,}[\w+#-]*")
+
+    @staticmethod
+    def is_fence(line: str) -> bool:
+        return SlideChunker.FENCE.fullmatch(line.strip()) is not None
+
+    @staticmethod
+    def split(content: str, suffix: str) -> List[str]:
+        if suffix == ".tex":
+            return SlideChunker.split_beamer(content)
+        return SlideChunker.split_marp(content)
+
+    @staticmethod
+    def _marp_body(content: str) -> List[str]:
+        lines = content.splitlines()
+        # Skip the front matter, which is not a slide.
+        if lines and lines[0].strip() == "---":
+            end = next((i for i in range(1, len(lines)) if lines[i].strip() == "---"), 0)
+            lines = lines[end + 1:]
+        return lines
+
+    @staticmethod
+    def marp_separators(content: str) -> int:
+        """The number of "---" lines after the front matter, fences or not, to check split_marp against."""
+        return sum(1 for line in SlideChunker._marp_body(content) if line.strip() == "---")
+
+    @staticmethod
+    def split_marp(content: str) -> List[str]:
+        lines = SlideChunker._marp_body(content)
+        slides, current, in_code = [], [], False
+        for line in lines:
+            if SlideChunker.is_fence(line):
+                in_code = not in_code
+            if line.strip() == "---" and not in_code:
+                slides.append("\n".join(current).strip())
+                current = []
+            else:
+                current.append(line)
+        slides.append("\n".join(current).strip())
+        return [slide for slide in slides if slide]
+
+    @staticmethod
+    def split_beamer(content: str) -> List[str]:
+        body = content.split("\\begin{document}", 1)[-1]
+        return [m.strip() for m in re.findall(r"\\begin\{frame\}.*?\\end\{frame\}", body, re.DOTALL)]
+
+
+class AnswerCache:
+    """
+    SQLite-backed cache of LectureBot answers.
+    Entries are keyed on (lecture number, lecture content hash, normalized question, model, temperature).
+    Entries of a lecture whose content hash changed are dropped by invalidate_lecture; the others are kept.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 20000, max_age: float = 30 * 24 * 3600):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS answers (
+                lec_no INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                question TEXT NOT NULL,
+                model TEXT NOT NULL,
+                temperature REAL NOT NULL,
+                answer TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (lec_no, content_hash, question, model, temperature))""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        return " ".join(question.lower().split()).rstrip("?？.。 ")
+
+    def invalidate_lecture(self, lec_no: int, content_hash: str):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM answers WHERE lec_no = ? AND content_hash != ?", (lec_no, content_hash))
+
+    def get(self, lec_no: int, content_hash: str, question: str, models: List[str], temperature: float) -> Optional[str]:
+        """Returns the answer of the first of models that has one. A question counts as one hit or one miss."""
+        key = (lec_no, content_hash, self.normalize_question(question), temperature)
+        now = time.time()
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT model, answer FROM answers WHERE lec_no = ? AND content_hash = ? AND question = ? AND temperature = ? "
+                f"AND created >= ? AND model IN ({', '.join('?' * len(models))})",
+                key + (now - self.max_age,) + tuple(models)).fetchall()
+            if not rows:
+                self.misses += 1
+                return None
+            model, answer = min(rows, key=lambda row: models.index(row[0]))
+            self.conn.execute(
+                "UPDATE answers SET last_used = ? WHERE lec_no = ? AND content_hash = ? AND question = ? AND temperature = ? AND model = ?",
+                (now,) + key + (model,))
+            self.hits += 1
+            return answer
+
+    def put(self, lec_no: int, content_hash: str, question: str, model: str, temperature: float, answer: str):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              (lec_no, content_hash, self.normalize_question(question), model, temperature, answer, now, now))
+            self.conn.execute("DELETE FROM answers WHERE created < ?", (now - self.max_age,))
+            # Evict the least recently used entries beyond capacity.
+            self.conn.execute("""DELETE FROM answers WHERE rowid IN (
+                SELECT rowid FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)""", (self.max_entries,))
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "size": size}
+
+
+class LectureCorpus:
+    """
+    Token-lean text of each lecture, as a list of slides (labeled by their PDF pages, see labels). Marp front matter,
+    styles and HTML layout, and the beamer preamble and markup are stripped. It is built once per version of the source
+    and cached on disk, keyed by the source hash.
+    """
+    VERSION = 2  # Bump when splitting, compact_marp or compact_beamer changes, so that cached slides are rebuilt.
+    cache_dir: Path = Path(__file__).parent / ".cache" / "corpus"
+
+    @staticmethod
+    def load(lec_no: int) -> Tuple[str, List[str]]:
+        """Returns the hash of the source file and the compact slides."""
+        main_file = LecturesMetadata.get_lecture_main_file(lec_no)
+        with open(main_file, 'r', encoding='utf-8') as file:
+            raw = file.read()
+        source_hash = LecturesMetadata.content_hash(raw)
+        cache_file = LectureCorpus.cache_dir / f"l{lec_no}.json"
         try:
-            with ThreadPoolExecutor(max_workers=workers) as executor:
-                futures = {executor.submit(self._summarize_lecture, i, 3): i for i in self.remaining}
-                for future in as_completed(futures):
-                    i = futures[future]
-                    try:
-                        results[i] = future.result()
-                    except Exception as e:
-                        print(f"Lecture {i} summarization failed: {e}")
-        except:
+            with open(cache_file, 'r', encoding='utf-8') as file:
+                cached = json.load(file)
+            if cached["source_hash"] == source_hash and cached["version"] == LectureCorpus.VERSION:
+                return source_hash, cached["slides"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
             pass
-        finally:
-            for i, res in results.items():
-                if res and (keywords := res.get("keywords")) and (brief := res.get("brief")):
-                    self.summary[str(i)] = {
-                        "title": self.titles[i],
-                        "keywords": keywords,
-                        "brief": brief
-                    }
-            self._save_summary()
+        compact = LectureCorpus.compact_beamer if main_file.suffix == ".tex" else LectureCorpus.compact_marp
+        split = SlideChunker.split(raw, main_file.suffix)
+        if main_file.suffix == ".md" and len(split) != SlideChunker.marp_separators(raw) + 1:
+            print(f"Warning: {main_file} was split into {len(split)} slides, but has {SlideChunker.marp_separators(raw)} "
+                  f"slide separators. Page numbers may be off; check its code fences.", file=sys.stderr)
+        slides = [compact(slide) for slide in split]
+        LectureCorpus.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix(".tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as file:
+            json.dump({"version": LectureCorpus.VERSION, "source_hash": source_hash, "slides": slides}, file, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+        return source_hash, slides
+
+    @staticmethod
+    def text(slides: List[str], pages: Optional[List[int]] = None, labels: Optional[List[str]] = None) -> str:
+        """Joins the given slides (all by default; 0-based indices) with their labels (by default, page i + 1)."""
+        pages = range(len(slides)) if pages is None else pages
+        return "\n\n".join(f"[{labels[i] if labels else f'Page {i + 1}'}]\n{slides[i]}" for i in pages if slides[i])
+
+    @staticmethod
+    def labels(lec_no: int, count: int) -> List[str]:
+        """
+        The label of each of the count slides of a lecture: "Page N", "Pages N-M" or "Frame N". Marp slide i is
+        page i + 1. A beamer frame spans one page per overlay step (\\pause, \\onslide, ...); its pages are read
+        from the .nav file LaTeX writes next to the PDF. Without one that matches the frames, they are labeled
+        by frame number, which is not a page number.
+        """
+        main_file = LecturesMetadata.get_lecture_main_file(lec_no)
+        if main_file.suffix != ".tex":
+            return [f"Page {i + 1}" for i in range(count)]
+        ranges = LectureCorpus._beamer_pages(main_file)
+        if ranges is None or len(ranges) != count:
+            return [f"Frame {i + 1}" for i in range(count)]
+        return [f"Page {first}" if first == last else f"Pages {first}-{last}" for first, last in ranges]
+
+    @staticmethod
+    def label_pages(label: str) -> range:
+        """The pages a label from labels stands for; none for a frame number."""
+        if (m := re.fullmatch(r"Pages? (\d+)(?:-(\d+))?", label)) is None:
+            return range(0)
+        return range(int(m[1]), int(m[2] or m[1]) + 1)
+
+    @staticmethod
+    def _beamer_pages(main_file: Path) -> Optional[List[Tuple[int, int]]]:
+        # The .nav file lists the pages of every frame, including the ones beamer adds at each (sub)section
+        # through \AtBeginSection or \AtBeginSubsection, which are not in the source and are left out.
+        try:
+            nav = main_file.with_suffix(".nav").read_text(encoding='utf-8')
+            preamble = main_file.read_text(encoding='utf-8').split("\\begin{document}", 1)[0]
+        except (FileNotFoundError, UnicodeDecodeError):
+            return None
+        added = {kind for kind in ("section", "subsection")
+                 if re.search(rf"\\AtBegin{kind.capitalize()}\s*(\[[^\]]*\])?\s*\{{\s*\\begin\{{frame\}}", preamble)}
+        ranges, skip = [], 0
+        for m in re.finditer(r"\\(sectionentry|beamer@subsectionentry) |\\beamer@framepages \{(\d+)\}\{(\d+)\}", nav):
+            if m[1]:
+                skip += ("subsection" if m[1] == "beamer@subsectionentry" else "section") in added
+            elif skip:
+                skip -= 1
+            else:
+                ranges.append((int(m[2]), int(m[3])))
+        return ranges
+
+    @staticmethod
+    def _outside_code(text: str, transform: Callable[[str], str]) -> str:
+        # Fenced code blocks are the odd-numbered parts. They are kept, only dedented.
+        parts = re.split(r"(^[ \t]*```.*?^[ \t]*```)", text, flags=re.MULTILINE | re.DOTALL)
+        return "".join(LectureCorpus._dedent_code(part) if i % 2 else transform(part) for i, part in enumerate(parts))
+
+    @staticmethod
+    def _dedent_code(block: str) -> str:
+        lines = block.splitlines()
+        return "\n".join([lines[0].strip(), textwrap.dedent("\n".join(lines[1:-1])), lines[-1].strip()])
+
+    @staticmethod
+    def _squeeze(text: str) -> str:
+        lines = [line.rstrip() for line in text.splitlines()]
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+    @staticmethod
+    def compact_marp(slide: str) -> str:
+        def transform(text: str) -> str:
+            text = re.sub(r"<style.*?</style>|<!--.*?-->", "", text, flags=re.DOTALL)
+            text = re.sub(r"<img\s+src=\"([^\"]+)\"[^>]*>", r"![](\1)", text)
+            text = re.sub(r"!\[[^\]]*\]\(", "![](", text)  # Marp image directives such as ![w:500]
+            text = re.sub(r"</?(div|a|span|font|center|u|p)\b[^>]*>", "", text)
+            return re.sub(r"^[ \t]+(?=!\[\]\()", "", text, flags=re.MULTILINE)
+        return LectureCorpus._squeeze(LectureCorpus._outside_code(slide, transform))
+
+    @staticmethod
+    def compact_beamer(frame: str) -> str:
+        arg = r"\{((?:[^{}]|\{[^{}]*\})*)\}"  # A brace group, allowing one level of nesting
+        text = re.sub(r"\\begin\{frame\}(\[[^\]]*\])?(" + arg + ")?", lambda m: f"## {m[3]}" if m[3] else "", frame)
+        text = re.sub(r"\\begin\{(cpp|txt)\}(\[[^\]]*\])?", lambda m: "```cpp" if m[1] == "cpp" else "```", text)
+        text = re.sub(r"\\end\{(cpp|txt)\}", "```", text)
+
+        def transform(text: str) -> str:
+            text = re.sub(r"^\s*%.*$", "", text, flags=re.MULTILINE)
+            text = re.sub(r"\\(begin|end)\{[a-z]+\*?\}(\{[^{}]*\})?(\[[^\]]*\])?", "", text)
+            text = re.sub(r"\\(pause|small|footnotesize|centering|quad|n)\b|\\onslide<[^>]*>", "", text)
+            text = re.sub(r"\\item\b\s*", "- ", text)
+            text = re.sub(r"\\(ilcpp|mono|redtt)" + arg, r"`\2`", text)
+            text = re.sub(r"\\textbf" + arg, r"**\1**", text)
+            text = re.sub(r"\\textit" + arg, r"*\1*", text)
+            text = re.sub(r"\\url" + arg, r"\1", text)
+            text = re.sub(r"\\[a-zA-Z]+" + arg, r"\1", text)  # Other formatting macros keep their text
+            return re.sub(r"^[ \t]+", "", text, flags=re.MULTILINE)
+        return LectureCorpus._squeeze(LectureCorpus._outside_code(text, transform))
+
+
+class LectureNotes:
+    """
+    The instructor's notes on a lecture (notes.txt in its directory), indexed by PDF page.
+    A note starts with a line "P8 ...", "P13,14 ..." or "P7-9 ...", and runs until the next one.
+    Text before the first note is about the lecture as a whole.
+    """
+    HEADER = re.compile(r"P(\d+(?:\s*[-,]\s*\d+)*)\s")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.general = ""
+        self.notes: List[Tuple[str, str]] = []  # (pages as written, note)
+        self.by_page: Dict[int, List[int]] = {}  # Indices into notes
+        label, lines = None, []
+        in_code = False
+        for line in text.splitlines():
+            header = None if in_code else self.HEADER.match(line)
+            if header:
+                self._add(label, lines)
+                label, lines, line = header[1].replace(" ", ""), [], line[header.end():]
+            if SlideChunker.is_fence(line):
+                in_code = not in_code
+            lines.append(line)
+        self._add(label, lines)
+
+    def _add(self, label: Optional[str], lines: List[str]):
+        note = "\n".join(lines).strip()
+        if label is None:
+            self.general = note
+            return
+        self.notes.append((label, note))
+        for part in label.split(","):
+            first, _, last = part.partition("-")
+            for page in range(int(first), int(last or first) + 1):
+                self.by_page.setdefault(page, []).append(len(self.notes) - 1)
+
+    @staticmethod
+    def load(lec_no: int) -> "LectureNotes":
+        try:
+            with open(LecturesMetadata.get_lecture_dir(lec_no) / "notes.txt", 'r', encoding='utf-8') as file:
+                return LectureNotes(file.read())
+        except FileNotFoundError:
+            return LectureNotes("")
+
+    def for_slides(self, slides: Optional[List[int]] = None, labels: Optional[List[str]] = None) -> str:
+        """
+        The notes on the given slides (all notes by default; 0-based indices), with their pages.
+        labels: those of LectureCorpus.labels, telling the pages of each slide; by default, slide i is page i + 1.
+        """
+        if slides is None:
+            notes = range(len(self.notes))
+        else:
+            pages = [page for slide in slides
+                     for page in (LectureCorpus.label_pages(labels[slide]) if labels else [slide + 1])]
+            notes = sorted({i for page in pages for i in self.by_page.get(page, [])})
+        text = f"[General]\n{self.general}\n\n" if self.general and slides is None else ""
+        for i in notes:
+            label, note = self.notes[i]
+            text += f"[{'Pages' if re.search(r'[-,]', label) else 'Page'} {label}]\n{note}\n\n"
+        return text.strip()
+
+
+class Snapshot:
+    """
+    Everything SlidesBot needs at startup, in one file: titles and summaries, the image map, the lecture index,
+    and the compact slides, notes and source hash of each lecture. The file starts with a JSON header line,
+    followed by one JSON record per lecture; it is memory-mapped, and a record is decoded only when its
+    LectureBot is created. The snapshot is rebuilt when any source file changes size or mtime.
+    """
+    VERSION = 1
+
+    def __init__(self, path: Path):
+        with open(path, 'rb') as file:
+            try:
+                self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                self.data = file.read()  # Empty files and some file systems cannot be mapped.
+        self.body = self.data.find(b"\n") + 1
+        self.header = json.loads(self.data[:self.body])
+        self.summaries: Dict[int, dict] = {int(lec_no): summary for lec_no, summary in self.header["summaries"].items()}
+
+    @staticmethod
+    def sources(readme_path: Path, summary_path: Path, main_files: Dict[int, Path]) -> Dict[str, Optional[List[int]]]:
+        """The size and mtime of every file the snapshot is built from. Lecture directories catch added or removed files."""
+        paths = [Path(__file__), readme_path, summary_path]
+        for lec_no, main_file in sorted(main_files.items()):
+            lec_dir = LecturesMetadata.get_lecture_dir(lec_no)
+            paths += [lec_dir, main_file, lec_dir / "notes.txt"]
+        sources = {}
+        for path in paths:
+            try:
+                stat = path.stat()
+                sources[os.path.abspath(path)] = [stat.st_mtime_ns, stat.st_size]
+            except FileNotFoundError:
+                sources[os.path.abspath(path)] = None
+        return sources
+
+    @staticmethod
+    def open(path: Path, readme_path: Path, summary_path: Path) -> Optional["Snapshot"]:
+        """Returns the snapshot if it is up to date, and fills the caches of LecturesMetadata from it."""
+        try:
+            snapshot = Snapshot(path)
+            header = snapshot.header
+            if header["version"] != Snapshot.VERSION or header["corpus_version"] != LectureCorpus.VERSION:
+                return None
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+        main_files = {int(lec_no): Path(main_file) for lec_no, main_file in header["main_files"].items()}
+        if header["sources"] != Snapshot.sources(readme_path, summary_path, main_files):
+            return None
+        LecturesMetadata.main_files.update(main_files)
+        LecturesMetadata.images.update({int(lec_no): images for lec_no, images in header["images"].items()})
+        for lec_no, main_file in main_files.items():
+            mtime_ns, size = header["sources"][os.path.abspath(main_file)]
+            LecturesMetadata.source_hashes[lec_no] = (mtime_ns, size, header["source_hashes"][str(lec_no)])
+        return snapshot
+
+    @staticmethod
+    def build(path: Path, readme_path: Path, summary_path: Path, summaries: Dict[int, dict]) -> "Snapshot":
+        Lec = LecturesMetadata
+        lecture_numbers = sorted(summaries)
+        main_files = {lec_no: Lec.get_lecture_main_file(lec_no) for lec_no in lecture_numbers}
+        sources = Snapshot.sources(readme_path, summary_path, main_files)
+        records, lectures, offset = [], {}, 0
+        texts, source_hashes = [], {}
+        for lec_no in lecture_numbers:
+            source_hash, slides = LectureCorpus.load(lec_no)
+            texts.append(LectureCorpus.text(slides))
+            source_hashes[lec_no] = source_hash
+            record = json.dumps({"source_hash": source_hash, "slides": slides, "notes": LectureNotes.load(lec_no).text},
+                                ensure_ascii=False).encode('utf-8') + b"\n"
+            lectures[lec_no] = [offset, len(record)]
+            records.append(record)
+            offset += len(record)
+        header = {
+            "version": Snapshot.VERSION,
+            "corpus_version": LectureCorpus.VERSION,
+            "sources": sources,
+            "main_files": {lec_no: str(main_file) for lec_no, main_file in main_files.items()},
+            "images": {lec_no: Lec.contains_images(lec_no) for lec_no in lecture_numbers},
+            "source_hashes": source_hashes,
+            "summaries": summaries,
+            "router": LectureRouter(lecture_numbers, texts).index.to_dict(),
+            "lectures": lectures,
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as file:
+            file.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b"\n")
+            file.writelines(records)
+        os.replace(tmp_path, path)
+        return Snapshot(path)
+
+    def router(self) -> LectureRouter:
+        return LectureRouter(sorted(self.summaries), index=BM25.from_dict(self.header["router"]))
+
+    def lecture(self, lec_no: int) -> Tuple[str, List[str], str]:
+        """Returns the source hash, the compact slides and the notes of a lecture."""
+        offset, length = self.header["lectures"][str(lec_no)]
+        record = json.loads(self.data[self.body + offset:self.body + offset + length])
+        return record["source_hash"], record["slides"], record["notes"]
 
 
 class LectureBot:
-    def __init__(self, lec_no: int, title: str, brief: str):
+    # At most this many slides are sent for a question, in page order.
+    max_slides: int = 8
+    # Fall back to the full lecture when the selected slides cover less than this
+    # fraction of the (idf-weighted) question terms that appear in the lecture.
+    min_coverage: float = 0.6
+    temperature: float = 0.3
+    NOT_COVERED = "This topic is not covered"
+    SELF_CHECK = """Finally, check your answer against the lecture content, and end it with a line "Confidence: high", "Confidence: medium" or "Confidence: low", telling how fully and accurately the lecture content supports it."""
+
+    def __init__(self, lec_no: int, title: str, brief: str, cache: Optional[AnswerCache] = None,
+                 snapshot: Optional[Snapshot] = None):
         assert LecturesMetadata.is_valid_lecture_number(lec_no)
         self.lec_no = lec_no
         self.title = title
         self.brief = brief # Maybe unused
-        with open(LecturesMetadata.get_lecture_main_file(self.lec_no), 'r', encoding='utf-8') as file:
-            self.content = file.read()
+        if snapshot is not None:
+            self.content_hash, self.slides, notes = snapshot.lecture(self.lec_no)
+            self.notes = LectureNotes(notes)
+        else:
+            self.content_hash, self.slides = LectureCorpus.load(self.lec_no)
+            self.notes = LectureNotes.load(self.lec_no)
+        self.labels = LectureCorpus.labels(self.lec_no, len(self.slides))
+        self.content = LectureCorpus.text(self.slides, labels=self.labels)
+        if self.notes.text:
+            # Cached answers depend on the notes too. The same as LecturesMetadata.get_lecture_hash, as of loading.
+            self.content_hash = LecturesMetadata.content_hash(self.content_hash + LecturesMetadata.content_hash(self.notes.text))
+        self.slide_index = BM25([BM25.tokenize(slide) for slide in self.slides])
+        self.cache = cache
+        # Calls in flight, by normalized question, shared by every concurrent question to this lecture: the
+        # future of the answer, and the call giving it, which runs as long as anyone is interested in it.
+        self.inflight: Dict[str, SimpleNamespace] = {}
+        self.inflight_lock = threading.Lock()
+        if self.cache:
+            self.cache.invalidate_lecture(self.lec_no, self.content_hash)
+
+    def _select_slides(self, question: str) -> Optional[List[int]]:
+        """Returns the 0-based indices of the slides relevant to the question, or None if the full lecture should be used."""
+        terms = {t for t in BM25.tokenize(question) if t in self.slide_index.idf}
+        if not terms:
+            return None
+        scores = self.slide_index.scores(list(terms))
+        ranked = sorted((i for i in range(len(scores)) if scores[i] > 0), key=lambda i: -scores[i])
+        selected = sorted(ranked[:self.max_slides])
+        if len(selected) * 2 >= len(self.slides):
+            return None
+        covered = {t for i in selected for t in terms if t in self.slide_index.term_freqs[i]}
+        total_weight = sum(self.slide_index.idf[t] for t in terms)
+        if sum(self.slide_index.idf[t] for t in covered) < self.min_coverage * total_weight:
+            return None
+        return selected
+
+    def _select_slides_for_all(self, questions: List[str]) -> Optional[List[int]]:
+        selected = set()
+        for question in questions:
+            if (slides := self._select_slides(question)) is None:
+                return None
+            selected.update(slides)
+        if len(selected) * 2 >= len(self.slides):
+            return None
+        return sorted(selected)
 
     def answer(self, question: str) -> str:
-        Lec = LecturesMetadata
-        system_prompt = f"""You are an expert teaching assistant for an introductory C/C++ programming course. Your task is to answer student questions based STRICTLY AND EXCLUSIVELY on the content of Lecture {self.lec_no}: "{self.title}", which is a {Lec.get_lecture_language(self.lec_no)} lecture.
+        return Scheduler.run(self.answer_async(question))
+
+    async def answer_async(self, question: str) -> str:
+        return (await self.answer_many_async([question]))[0]
+
+    async def answer_many_async(self, questions: List[str], hard: Optional[List[bool]] = None) -> List[str]:
+        """
+        Answers several questions about this lecture. Questions that are not cached are coalesced
+        into a single call, so that the lecture content is sent only once.
+        hard: which questions go straight to the last model of the specialist tier (see _answer_tiered).
+        """
+        with Tracer.span("specialist", lecture=self.lec_no, questions=len(questions)) as span:
+            hard = hard or [False] * len(questions)
+            models = LLM.tier_models("specialist")
+            answers: List[Optional[str]] = [None] * len(questions)
+            if self.cache:
+                for i, question in enumerate(questions):
+                    # The answers of later models are preferred, and only they count for hard questions.
+                    answers[i] = self.cache.get(self.lec_no, self.content_hash, question,
+                                                models[-1:] if hard[i] else models[::-1], self.temperature)
+            misses = [i for i, answer in enumerate(answers) if answer is None]
+            span["attributes"]["cache_hits"] = len(questions) - len(misses)
+            # Questions already being answered for someone else are awaited instead of asked again.
+            call = SimpleNamespace(task=None, interest=1)
+            shared, owned, joined = {}, {}, {}
+            with self.inflight_lock:
+                for i in misses:
+                    key = AnswerCache.normalize_question(questions[i])
+                    if key in self.inflight and self.inflight[key].call.interest > 0:
+                        shared[i] = self.inflight[key]
+                        if shared[i].call is not call and id(shared[i].call) not in joined:
+                            joined[id(shared[i].call)] = shared[i].call
+                            shared[i].call.interest += 1
+                    else:
+                        self.inflight[key] = SimpleNamespace(future=concurrent.futures.Future(), call=call)
+                        owned[i] = key
+            span["attributes"]["deduplicated"] = len(shared)
+            calls = list(joined.values()) + ([call] if owned else [])
+            try:
+                if owned:
+                    # Shielded, so that the call goes on for the others waiting for it if this question is abandoned.
+                    call.task = asyncio.ensure_future(self._answer_owned(
+                        [questions[i] for i in owned], [hard[i] for i in owned], models, span,
+                        {key: self.inflight[key] for key in owned.values()}))
+                    call.task.add_done_callback(self._retrieve)
+                    for i, answer in zip(owned, await asyncio.shield(call.task)):
+                        answers[i] = answer
+                for i, entry in shared.items():
+                    waiting = asyncio.wrap_future(entry.future)
+                    waiting.add_done_callback(self._retrieve)
+                    answers[i] = await asyncio.shield(waiting)
+            finally:
+                self._leave(calls)
+            return answers
+
+    async def _answer_owned(self, questions: List[str], hard: List[bool], models: List[str], span: dict,
+                            entries: Dict[str, SimpleNamespace]) -> List[str]:
+        try:
+            fresh = await self._answer_tiered(questions, hard, models, span)
+        except BaseException as e:
+            self._release(entries, error=e)
+            raise
+        if self.cache:
+            for question, (answer, model) in zip(questions, fresh):
+                self.cache.put(self.lec_no, self.content_hash, question, model, self.temperature, answer)
+        # Questions asked twice in the same call share one entry.
+        self._release(entries, answers={AnswerCache.normalize_question(question): answer
+                                        for question, (answer, _) in zip(questions, fresh)})
+        return [answer for answer, _ in fresh]
+
+    async def _answer_tiered(self, questions: List[str], hard: List[bool], models: List[str], span: dict) -> List[Tuple[str, str]]:
+        """
+        Returns the answers and the models that gave them. Questions are answered with the first model, with a
+        self-check; those whose answers say the topic is not covered, or are rated low confidence, are asked
+        again with the last model. Hard questions are asked to the last model right away.
+        """
+        results: List[Optional[Tuple[str, str]]] = [None] * len(questions)
+        direct = [i for i in range(len(questions)) if hard[i] or len(models) == 1]
+        cheap = [i for i in range(len(questions)) if i not in direct]
+        direct_task = asyncio.ensure_future(self._answer_all([questions[i] for i in direct], models[-1])) if direct else None
+        try:
+            escalated = []
+            if cheap:
+                for i, answer in zip(cheap, await self._answer_all([questions[i] for i in cheap], models[0], self_check=True)):
+                    answer, confident = self._self_check(answer)
+                    if confident and self.NOT_COVERED.lower() not in answer.lower():
+                        results[i] = (answer, models[0])
+                    else:
+                        escalated.append(i)
+            span["attributes"]["escalated"] = len(escalated)
+            if escalated:
+                for i, answer in zip(escalated, await self._answer_all([questions[i] for i in escalated], models[-1])):
+                    results[i] = (answer, models[-1])
+            if direct_task:
+                for i, answer in zip(direct, await direct_task):
+                    results[i] = (answer, models[-1])
+        finally:
+            if direct_task:
+                direct_task.cancel()
+        return results
+
+    async def _answer_all(self, questions: List[str], model: str, self_check: bool = False) -> List[str]:
+        if len(questions) == 1:
+            return [await self._answer(questions[0], model, self_check)]
+        return await self._answer_coalesced(questions, model, self_check)
+
+    @staticmethod
+    def _self_check(answer: str) -> Tuple[str, bool]:
+        """Strips the confidence line asked for by self_check. An answer without one is taken as confident."""
+        if (m := re.search(r"\s*\**Confidence\**:\**\s*(high|medium|low)\W*$", answer, re.IGNORECASE)) is None:
+            return answer, True
+        return answer[:m.start()], m[1].lower() != "low"
+
+    def _release(self, entries: Dict[str, SimpleNamespace], answers: Optional[Dict[str, str]] = None,
+                 error: Optional[BaseException] = None):
+        with self.inflight_lock:
+            for key, entry in entries.items():
+                if self.inflight.get(key) is entry:
+                    del self.inflight[key]
+                if answers is not None:
+                    entry.future.set_result(answers[key])
+                else:
+                    # Waiters must not be cancelled because the call was.
+                    entry.future.set_exception(RuntimeError(f"The shared call failed: {error!r}"))
+
+    @staticmethod
+    def _retrieve(future: asyncio.Future):
+        # Failures of shared calls reach whoever is still waiting; this keeps asyncio from logging them when nobody is.
+        if not future.cancelled():
+            future.exception()
+
+    def _leave(self, calls: List[SimpleNamespace]):
+        """Drops interest in shared calls, cancelling those nobody is waiting for anymore."""
+        with self.inflight_lock:
+            for call in calls:
+                call.interest -= 1
+                if call.interest == 0 and call.task is not None:
+                    call.task.cancel()
+
+    def _system_prompt(self, questions: List[str]) -> str:
+        if (selected := self._select_slides_for_all(questions)) is not None:
+            content_header = "Lecture content (excerpt: only the slides relevant to the question, with their page numbers):"
+            content = LectureCorpus.text(self.slides, selected, self.labels)
+        else:
+            content_header = "Lecture content (with page numbers):"
+            content = self.content
+        # Only the instructor's notes on the slides sent are attached.
+        if notes := self.notes.for_slides(selected, self.labels):
+            content += f"""
+
+Instructor's notes on these slides, by page (corrections and clarifications; they take precedence over the slides):
+
+{notes}"""
+        return f"""You are an expert teaching assistant for an introductory C/C++ programming course. Your task is to answer student questions based STRICTLY AND EXCLUSIVELY on the content of Lecture {self.lec_no}: "{self.title}", which is a {LecturesMetadata.get_lecture_language(self.lec_no)} lecture.
 
 CRITICAL INSTRUCTIONS:
 - Answer ONLY based on the provided lecture content
@@ -298,36 +1468,451 @@ CRITICAL INSTRUCTIONS:
 - Stay within the scope of what is actually taught in this specific lecture
 - External links, especially to cppreference.com, may be present in the lecture content. If they are relevant and important, you can include them in your answer using standard Markdown link syntax "[]()". Do NOT fabricate or assume any links; only use those explicitly provided in the lecture.
 
-Lecture content:
+{content_header}
+
+{content}"""
 
-{self.content}"""
+    def _image_note(self) -> str:
+        Lec = LecturesMetadata
+        if not Lec.contains_images(self.lec_no):
+            return ""
+        return f"""\nNote: If you want to use the images from the lecture, just use the normal Markdown syntax "![]()" and add {Lec.get_lecture_dir(self.lec_no).absolute()} before the images' relative paths."""
 
+    async def _answer(self, question: str, model: str, self_check: bool = False) -> str:
         user_prompt = f"""Give an detailed answer to the following question using ONLY the information provided in the lecture content. Do not supplement with external knowledge.
 
 Question: {question}
 """
-        if Lec.contains_images(self.lec_no):
-            user_prompt += f"""\nNote: If you want to use the images from the lecture, just use the normal Markdown syntax "![]()" and add {Lec.get_lecture_dir(self.lec_no).absolute()} before the images' relative paths."""
+        user_prompt += self._image_note()
+        if self_check:
+            user_prompt += f"\n{self.SELF_CHECK}"
 
-        return LLM(always_reason=True).invoke(
+        return await LLM(always_reason=True).ainvoke(
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": self._system_prompt([question])},
                 {"role": "user", "content": user_prompt}
             ],
-            temperature=0.3
+            model=model,
+            temperature=self.temperature
         )
 
+    async def _answer_coalesced(self, questions: List[str], model: str, self_check: bool = False) -> List[str]:
+        numbered = "\n".join(f"{i + 1}. {question}" for i, question in enumerate(questions))
+        user_prompt = f"""Give a detailed answer to each of the following {len(questions)} questions using ONLY the information provided in the lecture content. Do not supplement with external knowledge. Answer each question on its own, as if it were asked alone.
+
+Questions:
+{numbered}
+
+Output as JSON with an "answers" array holding exactly {len(questions)} strings, the i-th being the answer to the i-th question. Example format:
+
+```json
+{{
+    "answers": ["Answer to question 1", "Answer to question 2", "..."]
+}}
+```
+"""
+        user_prompt += self._image_note()
+        if self_check:
+            user_prompt += f"\n{self.SELF_CHECK} Do this for each answer, within its string."
+
+        try:
+            response = json.loads(await LLM(always_reason=True).ainvoke(
+                messages=[
+                    {"role": "system", "content": self._system_prompt(questions)},
+                    {"role": "user", "content": user_prompt}
+                ],
+                model=model,
+                temperature=self.temperature,
+                response_format={"type": "json_object"}
+            ))
+            answers = response["answers"]
+            if isinstance(answers, list) and len(answers) == len(questions) and all(isinstance(a, str) for a in answers):
+                return answers
+        except (json.JSONDecodeError, KeyError, TypeError):
+            pass
+        # The combined response is unusable. Answer the questions one by one instead.
+        return list(await asyncio.gather(*(self._answer(question, model, self_check) for question in questions)))
+
+
+class SimilarQuestionCache:
+    """
+    Final answers of earlier questions, looked up by similarity. Questions are turned into TF-IDF vectors of
+    character n-grams, hashed into a fixed number of dimensions and held in a NumPy matrix, so that a lookup
+    is one matrix-vector product. Above threshold, and with the same words, the stored answer is returned as
+    is; otherwise, above seed_threshold, it is offered to the coordinator as a starting point. An entry is
+    dropped when any lecture consulted for its answer has changed (its main file or its notes), and the least
+    recently used entry is evicted when the cache is full.
+    """
+
+    def __init__(self, path: Optional[Path], capacity: int = 1000, threshold: float = 0.9, seed_threshold: float = 0.75,
+                 dims: int = 4096, ngrams: Tuple[int, int] = (3, 5)):
+        # NumPy is an optional dependency, only needed by this cache. It is imported, and the cache
+        # file read, on the first lookup, so that startup does not pay for them.
+        if importlib.util.find_spec("numpy") is None:
+            raise ImportError("No module named 'numpy'")
+        self.np = None
+        self.path = path
+        self.capacity = capacity
+        self.threshold = threshold
+        self.seed_threshold = seed_threshold
+        self.dims = dims
+        self.ngrams = ngrams
+        # Per slot, the hashed n-grams of the question and their sublinear term frequencies. The matrix holds
+        # them weighted by idf and normalized, so a lookup is a single product. Document frequencies are
+        # kept up to date as entries come and go; the idf, and with it the matrix, is only recomputed once
+        # a tenth of the entries have changed since.
+        self.vectors: List[Optional[tuple]] = [None] * capacity
+        self.matrix = None
+        self.df = None
+        self.idf = None
+        self.changes = 0
+        self.entries: List[Optional[dict]] = [None] * capacity
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.seeds = 0
+        self.misses = 0
+
+    def _load(self):
+        if self.np is not None:
+            return
+        import numpy
+        self.np = numpy
+        self.matrix = numpy.zeros((self.capacity, self.dims), dtype=numpy.float32)
+        self.df = numpy.zeros(self.dims, dtype=numpy.int32)
+        self.idf = numpy.ones(self.dims, dtype=numpy.float32)
+        if self.path and self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as file:
+                for entry in json.load(file)[-self.capacity:]:
+                    self._insert(entry)
+
+    # Symbols that change what a question is about ("C" vs "C++" or "C#", "a::b", "int*", "a<b>", "i++ + ++i").
+    # They are kept in the n-grams, and questions whose tokens containing them differ never match.
+    SYMBOLS = r"+#:*&<>\[\]"
+
+    @classmethod
+    def _normalize(cls, question: str) -> str:
+        return " ".join(re.sub(rf"[^\w\s{cls.SYMBOLS}]", " ", question.lower()).split())
+
+    @classmethod
+    def _symbol_tokens(cls, question: str) -> List[str]:
+        return [token for token in cls._normalize(question).split() if re.search(rf"[{cls.SYMBOLS}]", token)]
+
+    @staticmethod
+    def _words(question: str) -> frozenset:
+        # A single word can turn a question into its opposite ("signed"/"unsigned", "can"/"can't"), which the
+        # n-gram similarity barely sees, so an answer is only reused as is when the words are the same.
+        question = re.sub(r"\bcannot\b", "can not", re.sub(r"n['\u2019]t\b", " not", question.lower()))
+        return frozenset(BM25.tokenize(question))
+
+    def _vectorize(self, question: str):
+        text = " " + self._normalize(question) + " "
+        counts = Counter(zlib.crc32(text[i:i + n].encode('utf-8')) % self.dims
+                         for n in range(self.ngrams[0], self.ngrams[1] + 1) for i in range(len(text) - n + 1))
+        indices = self.np.array(list(counts.keys()), dtype=self.np.intp)
+        return indices, 1 + self.np.log(self.np.array(list(counts.values()), dtype=self.np.float32))
+
+    def _weigh(self, vector):
+        indices, tf = vector
+        weights = tf * self.idf[indices]
+        norm = self.np.linalg.norm(weights)
+        return indices, weights / norm if norm else weights
+
+    def _reweigh(self):
+        count = sum(vector is not None for vector in self.vectors)
+        self.idf = (self.np.log((1 + count) / (1 + self.df)) + 1).astype(self.np.float32)
+        for slot, vector in enumerate(self.vectors):
+            if vector is not None:
+                indices, weights = self._weigh(vector)
+                self.matrix[slot, indices] = weights
+        self.changes = 0
+
+    def _scores(self, vector):
+        if self.changes * 10 > sum(vector is not None for vector in self.vectors):
+            self._reweigh()
+        indices, weights = self._weigh(vector)
+        query = self.np.zeros(self.dims, dtype=self.np.float32)
+        query[indices] = weights
+        return self.matrix @ query
+
+    def lookup(self, question: str, lecture_hash: Callable[[int], str] = LecturesMetadata.get_lecture_hash
+               ) -> Optional[Tuple[float, dict, bool]]:
+        """
+        Returns the most similar valid entry, its similarity, and whether its answer can be returned as is,
+        if the similarity reaches seed_threshold. That takes threshold and the same words as the question;
+        otherwise the entry is only a seed. lecture_hash gives the hash of the content answers about a
+        lecture are currently given from.
+        """
+        symbols, words = self._symbol_tokens(question), self._words(question)
+        with self.lock:
+            self._load()
+            scores = self._scores(self._vectorize(question))
+            candidates = self.np.flatnonzero(scores >= self.seed_threshold)
+            for slot in candidates[self.np.argsort(-scores[candidates])]:
+                entry = self.entries[slot]
+                if self._symbol_tokens(entry["question"]) != symbols:
+                    continue  # E.g. the same question about C and C++.
+                if any(lecture_hash(int(lec_no)) != source_hash
+                       for lec_no, source_hash in entry["lectures"].items()):
+                    self._remove(slot)  # A consulted lecture has changed since.
+                    continue
+                entry["last_used"] = time.time()
+                reuse = bool(scores[slot] >= self.threshold) and self._words(entry["question"]) == words
+                if reuse:
+                    self.hits += 1
+                else:
+                    self.seeds += 1
+                return float(scores[slot]), entry, reuse
+            self.misses += 1
+            return None
+
+    def put(self, question: str, answer: str, lectures: Dict[int, str]):
+        """lectures: the hash of the content of each lecture consulted for the answer, as it was when consulted."""
+        entry = {"question": question, "answer": answer, "last_used": time.time(),
+                 "lectures": {str(lec_no): source_hash for lec_no, source_hash in lectures.items()}}
+        with self.lock:
+            self._load()
+            self._insert(entry)
+            self._save()
+
+    def _insert(self, entry: dict):
+        free = [slot for slot, e in enumerate(self.entries) if e is None]
+        slot = free[0] if free else min(range(self.capacity), key=lambda slot: self.entries[slot]["last_used"])
+        if self.entries[slot] is not None:
+            self._remove(slot)
+        vector = self._vectorize(entry["question"])
+        self.entries[slot] = entry
+        self.vectors[slot] = vector
+        self.df[vector[0]] += 1
+        indices, weights = self._weigh(vector)
+        self.matrix[slot, indices] = weights
+        self.changes += 1
+
+    def _remove(self, slot: int):
+        # Persisted with the next put; until then, a reload drops the entry again for the same reason.
+        self.df[self.vectors[slot][0]] -= 1
+        self.matrix[slot] = 0
+        self.entries[slot] = None
+        self.vectors[slot] = None
+        self.changes += 1
+
+    def _save(self):
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(sorted((e for e in self.entries if e), key=lambda e: e["last_used"]), file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "seeds": self.seeds, "misses": self.misses,
+                    "size": sum(e is not None for e in self.entries)}
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly 4 ASCII characters per token; other characters (mostly CJK here) count as one token each.
+    ascii_chars = sum(c.isascii() for c in text)
+    return ascii_chars // 4 + len(text) - ascii_chars
+
+
+class StreamedField:
+    """
+    Fed with a JSON object piece by piece, as it is streamed, passes the decoded text of its top-level
+    string field key to on_text as soon as it arrives, so that the coordinator's final answer can be
+    shown before the JSON envelope is complete. If the response then turns out to be unusable, retract
+    calls on_text with None, so that the text passed on so far is discarded.
+    """
+    ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self, key: str, on_text: Callable[[str], None]):
+        self.key = key
+        self.on_text = on_text
+        self.emitted = False
+        self._reset()
+
+    def _reset(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string = ""  # The last string outside the field, to recognize keys
+        self.value_of = None  # The key whose value comes next
+        self.in_field = False
+        self.unicode = None  # Hex digits of a \u escape in the field
+        self.surrogate = None  # A high surrogate waiting for its low half
+
+    def __call__(self, delta: str):
+        out = []
+        for ch in delta:
+            if self.in_field:
+                self._field_char(ch, out)
+            elif self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                else:
+                    self.string += ch
+            elif ch == '"':
+                if self.depth == 1 and self.value_of == self.key:
+                    self.in_field = True
+                else:
+                    self.in_string, self.string = True, ""
+            elif ch == ':' and self.depth == 1:
+                self.value_of = self.string
+            elif not ch.isspace():
+                self.value_of = None
+                self.depth += (ch in "{[") - (ch in "}]")
+        if out:
+            self.emitted = True
+            self.on_text("".join(out))
+
+    def retract(self):
+        if self.emitted:
+            self.emitted = False
+            self.on_text(None)
+
+    def restart(self):
+        """Retracts the text so far, and starts over with a new response."""
+        self.retract()
+        self._reset()
+
+    def _field_char(self, ch: str, out: List[str]):
+        if self.unicode is not None:
+            self.unicode += ch
+            if len(self.unicode) < 4:
+                return
+            code, self.unicode = int(self.unicode, 16), None
+            if 0xD800 <= code < 0xDC00:
+                self.surrogate = code
+            elif 0xDC00 <= code < 0xE000 and self.surrogate is not None:
+                out.append(chr(0x10000 + ((self.surrogate - 0xD800) << 10) + code - 0xDC00))
+                self.surrogate = None
+            else:
+                out.append(chr(code))
+        elif self.escape:
+            self.escape = False
+            if ch == 'u':
+                self.unicode = ""
+            else:
+                out.append(self.ESCAPES.get(ch, ch))
+        elif ch == '\\':
+            self.escape = True
+        elif ch == '"':
+            self.in_field, self.value_of = False, None
+        else:
+            out.append(ch)
+
+
+class CoordinatorContext:
+    """
+    The coordinator's messages, grouped into rounds. The system prompt and the student's question are
+    always kept as they are. When the messages exceed the token budget, the oldest rounds except the
+    latest one are replaced by a condensed list of the facts they gathered.
+    """
+    max_fact_chars: int = 600
+
+    def __init__(self, system_prompt: str, prompt: str, budget: Optional[int], mode: str = "extractive"):
+        self.head = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        self.budget = budget
+        self.mode = mode
+        self.facts = ""
+        self.rounds: List[dict] = []
+
+    def new_round(self):
+        self.rounds.append({"messages": [], "answers": []})
+
+    def append(self, message: Dict[str, str]):
+        if not self.rounds:
+            self.new_round()
+        self.rounds[-1]["messages"].append(message)
+
+    def add_answers(self, questions: List[dict], results: List[str]):
+        self.rounds[-1]["answers"].extend(zip(questions, results))
+
+    def messages(self) -> List[Dict[str, str]]:
+        messages = list(self.head)
+        if self.facts:
+            messages.append({"role": "user", "content": f"Facts gathered in earlier rounds (condensed):\n\n{self.facts}"})
+        for round in self.rounds:
+            messages.extend(round["messages"])
+        return messages
+
+    def estimate_tokens(self) -> int:
+        return sum(estimate_tokens(m["content"]) for m in self.messages())
+
+    async def compact(self):
+        if not self.budget or len(self.rounds) <= 1 or self.estimate_tokens() <= self.budget:
+            return
+        with Tracer.span("compaction", mode=self.mode, tokens_before=self.estimate_tokens()) as span:
+            previous_facts, old = self.facts, []
+            while len(self.rounds) > 1 and self.estimate_tokens() > self.budget:
+                old.append(self.rounds.pop(0))
+                self.facts = self._condense_extractive(self.facts, old[-1:])
+            if self.mode == "llm":
+                try:
+                    self.facts = await self._condense_llm(previous_facts, old)
+                except Exception as e:
+                    span["attributes"]["fallback"] = repr(e)  # Keep the extractive facts.
+            span["attributes"]["rounds_condensed"] = len(old)
+            span["attributes"]["tokens_after"] = self.estimate_tokens()
+
+    @staticmethod
+    def _answer_text(result: str) -> Optional[str]:
+        if not result.startswith("From lecture"):
+            return None  # Errors carry no facts.
+        return result.split("\n", 1)[-1].strip()
+
+    @classmethod
+    def _condense_extractive(cls, facts: str, rounds: List[dict]) -> str:
+        lines = [facts] if facts else []
+        for round in rounds:
+            for q, result in round["answers"]:
+                if (text := cls._answer_text(result)) is None:
+                    continue
+                text = " ".join(text.split())
+                if len(text) > cls.max_fact_chars:
+                    # Cut at the last sentence end within the limit, if there is one.
+                    cut = text[:cls.max_fact_chars]
+                    end = max(cut.rfind(". "), cut.rfind("。"))
+                    text = (cut[:end + 1] if end > 0 else cut) + " ..."
+                lines.append(f"- Lecture {q['lecture_number']}, asked \"{q['question']}\": {text}")
+        return "\n".join(lines)
+
+    async def _condense_llm(self, facts: str, rounds: List[dict]) -> str:
+        qa = "\n\n".join(f"Lecture {q['lecture_number']}\nQuestion: {q['question']}\nAnswer: {text}"
+                          for round in rounds for q, result in round["answers"]
+                          if (text := self._answer_text(result)) is not None)
+        prompt = f"""Condense the following information, gathered from lecture specialists of a C/C++ course, into a concise list of facts (Markdown bullet points). Keep the lecture number of each fact, important code snippets, image paths and links. Drop repetitions and anything that says a topic is not covered. Use at most {self.budget // 4} words.
+
+Facts gathered before:
+{facts or "(none)"}
+
+New questions and answers:
+
+{qa}"""
+        return await LLM().ainvoke([{"role": "user", "content": prompt}], model=LLM.basic_model, temperature=0.2)
+
 
 class InternalStepsPrinter:
-    def __init__(self):
-        pass
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
 
     def asking_over_lectures(self, reasoning: str, questions: List[dict]):
+        if not self.enabled:
+            return
         print(f"\n\033[1mAsking questions based on reasoning:\033[0m {reasoning}\n")
         json.dump(questions, sys.stdout, indent=2, ensure_ascii=False)
         print('-' * 20)
 
     def received_answers_over_lectures(self, questions: List[dict], answers: List[str]):
+        if not self.enabled:
+            return
         print(f"\n\033[1mReceived answers from lectures:\033[0m\n")
         for q, a in zip(questions, answers):
             print(f"Question:\n\tOver Lecture {q['lecture_number']}\n\t{q['question']}\n\nAnswer: {a}\n")
@@ -335,56 +1920,263 @@ class InternalStepsPrinter:
 
 
 class SlidesBot:
-    def __init__(self, summary_path: Path, readme_path: Path):
-        init = Initializer(readme_path=readme_path, summary_path=summary_path)
-        init.work(max_workers=12)
-        self.lecture_summaries = {int(lec_no): summary for lec_no, summary in init.summary.items()}
+    FAILED_ANSWER = "Failed to generate a final answer after maximum attempts."
+
+    def __init__(self, summary_path: Path, readme_path: Path, answer_cache_path: Optional[Path] = None,
+                 snapshot_path: Optional[Path] = None):
+        """If snapshot_path is given, startup loads it instead of checking every lecture (see Snapshot)."""
+        self.snapshot = Snapshot.open(snapshot_path, readme_path, summary_path) if snapshot_path else None
+        if self.snapshot is None:
+            init = Initializer(readme_path=readme_path, summary_path=summary_path)
+            init.work(max_workers=12)
+            self.lecture_summaries = {int(lec_no): summary for lec_no, summary in init.summary.items()}
+            # Outdated summaries are not frozen into a snapshot, so that the next run tries to update them again.
+            if snapshot_path and not init._get_remaining_lectures():
+                self.snapshot = Snapshot.build(snapshot_path, readme_path, summary_path, self.lecture_summaries)
+        else:
+            self.lecture_summaries = self.snapshot.summaries
         assert all(lec_no in self.lecture_summaries for lec_no in LecturesMetadata.get_valid_lecture_numbers())
 
         self.llm = LLM(always_reason=True)
         self.lecture_bots : Dict[int, LectureBot] = {}
+        self.lecture_bots_lock = threading.Lock()
         self.internal_printer = InternalStepsPrinter()
+        self.router = self.snapshot.router() if self.snapshot else LectureRouter(sorted(self.lecture_summaries.keys()))
+        self.answer_cache = AnswerCache(answer_cache_path) if answer_cache_path else None
+        self.similar_cache: Optional[SimilarQuestionCache] = None
+        self.context_budget: Optional[int] = 16000
+        self.compaction = "extractive"
+
+        # Speculative prefetch: see _speculate.
+        self.speculative = False
+        self.speculative_lectures = 2
+        self.speculative_budget = 500  # Speculative calls left for this process
+        self.speculation_stats: Counter = Counter()
+        self.speculation_lock = threading.Lock()
+        self.summary_router = LectureRouter(
+            sorted(self.lecture_summaries.keys()),
+            [f"{info['title']} {' '.join(info['keywords'])}" for _, info in sorted(self.lecture_summaries.items())])
+
+    def _speculate(self, question: str) -> Dict[int, asyncio.Task]:
+        """
+        Starts asking the student's question to the lectures that most likely cover it, as ranked by
+        their titles and keywords, so that their answers may be ready when the coordinator picks them.
+        The coordinator's own questions to a picked lecture are still asked (only those identical to the
+        student's share the speculative call), so speculation saves a round trip only when the coordinator
+        can give its final answer from the speculative answers.
+        """
+        ranked = self.summary_router.rank(question)
+        with self.speculation_lock:
+            lectures = ranked[:min(self.speculative_lectures, self.speculative_budget)]
+            self.speculative_budget -= len(lectures)
+            self.speculation_stats["launched"] += len(lectures)
+        return {lec_no: asyncio.ensure_future(self._ask_lecture_bot(lec_no, [question])) for lec_no in lectures}
+
+    async def _use_speculation(self, speculation: Dict[int, asyncio.Task], picked: set, question: str,
+                               deadline: Optional[float], on_specialist: Optional[Callable[[int, str, str], None]] = None
+                               ) -> List[Tuple[dict, str]]:
+        """
+        Waits for the speculative answers of the picked lectures and discards the others. Only the answers
+        that arrive in time and are used count as hits; the rest are wasted.
+        """
+        hits = {lec_no: task for lec_no, task in speculation.items() if lec_no in picked}
+        self._discard_speculation({lec_no: task for lec_no, task in speculation.items() if lec_no not in picked})
+        speculation.clear()
+        if not hits:
+            return []
+        results = []
+        try:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            _, pending = await asyncio.wait(hits.values(), timeout=timeout)
+            for lec_no, task in hits.items():
+                if task not in pending and not task.cancelled() and task.exception() is None:
+                    if on_specialist is not None:
+                        on_specialist(lec_no, question, task.result()[0])
+                    results.append(({"lecture_number": lec_no, "question": question},
+                                    f"From lecture {lec_no} (the student's original question):\n{task.result()[0]}\n\n"))
+        finally:
+            for task in hits.values():
+                task.cancel()
+            with self.speculation_lock:
+                self.speculation_stats["hits"] += len(results)
+                self.speculation_stats["wasted"] += len(hits) - len(results)
+        return results
 
-    def _ask_lecture_bot(self, lec_no: int, question: str) -> str:
-        if lec_no in self.lecture_summaries:
-            lec_info = self.lecture_summaries[lec_no]
+    def _discard_speculation(self, speculation: Dict[int, asyncio.Task]):
+        for task in speculation.values():
+            task.cancel()
+        with self.speculation_lock:
+            self.speculation_stats["wasted"] += len(speculation)
+
+    def speculation_hit_rate(self) -> Optional[float]:
+        with self.speculation_lock:
+            launched = self.speculation_stats["launched"]
+            return self.speculation_stats["hits"] / launched if launched else None
+
+    def stats(self) -> dict:
+        """The counters of the caches and of speculation since the bot was created."""
+        with self.speculation_lock:
+            speculation = {key: self.speculation_stats[key] for key in ("launched", "hits", "wasted")}
+        speculation["hit_rate"] = self.speculation_hit_rate()
+        return {"answer_cache": self.answer_cache.stats() if self.answer_cache else None,
+                "similar_cache": self.similar_cache.stats() if self.similar_cache else None,
+                "speculation": speculation}
+
+    def preload(self):
+        """Loads every lecture up front, so that no question pays for reading lecture files."""
+        for lec_no in sorted(self.lecture_summaries.keys()):
+            self._get_lecture_bot(lec_no)
+
+    def _get_lecture_bot(self, lec_no: int) -> LectureBot:
+        # Questions may be answered concurrently from several threads.
+        with self.lecture_bots_lock:
             if lec_no not in self.lecture_bots:
-                self.lecture_bots[lec_no] = LectureBot(lec_no, lec_info["title"], lec_info["brief"])
-            return self.lecture_bots[lec_no].answer(question)
+                lec_info = self.lecture_summaries[lec_no]
+                self.lecture_bots[lec_no] = LectureBot(lec_no, lec_info["title"], lec_info["brief"], self.answer_cache, self.snapshot)
+            return self.lecture_bots[lec_no]
+
+    def _lecture_hash(self, lec_no: int) -> str:
+        """
+        The hash of the content answers about the lecture are given from: that its LectureBot loaded, which is
+        kept even if the files change, or that of the files if it is not loaded yet.
+        """
+        with self.lecture_bots_lock:
+            lecture_bot = self.lecture_bots.get(lec_no)
+        return lecture_bot.content_hash if lecture_bot is not None else LecturesMetadata.get_lecture_hash(lec_no)
+
+    async def _ask_lecture_bot(self, lec_no: int, questions: List[str], hard: Optional[List[bool]] = None) -> List[str]:
+        if lec_no in self.lecture_summaries:
+            return await self._get_lecture_bot(lec_no).answer_many_async(questions, hard)
         else:
             valid_numbers = LecturesMetadata.get_valid_lecture_numbers()
-            return f"Error: {lec_no} is not a valid lecture number. Valid numbers are {valid_numbers[0]}-{valid_numbers[-1]}."
-
-    def _process_lecture_questions(self, reasoning: str, questions: List[dict], max_workers: int) -> List[str]:
-        self.internal_printer.asking_over_lectures(reasoning, questions)
-        results = {}
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_question = {
-                executor.submit(self._ask_lecture_bot, q["lecture_number"], q["question"]): (i, q)
-                for i, q in enumerate(questions)
-            }
-            for future in as_completed(future_to_question):
-                i, q = future_to_question[future]
-                try:
-                    answer = future.result()
-                    results[i] = f"From lecture {q['lecture_number']}:\n{answer}\n\n"
-                except Exception as e:
-                    results[i] = f"Error: {e}\n\n"
-        results = [results[i] for i in range(len(results))]
-        self.internal_printer.received_answers_over_lectures(questions, results)
-        return results
+            return [f"Error: {lec_no} is not a valid lecture number. Valid numbers are {valid_numbers[0]}-{valid_numbers[-1]}."] * len(questions)
+
+    async def _process_lecture_questions(self, reasoning: str, questions: List[dict], deadline: Optional[float] = None,
+                                         on_specialist: Optional[Callable[[int, str, str], None]] = None) -> List[str]:
+        """on_specialist(lecture_number, question, answer) is called for each answer as soon as its lecture has answered."""
+        with Tracer.span("fan_out", questions=len(questions)) as span:
+            self.internal_printer.asking_over_lectures(reasoning, questions)
+            # Questions to the same lecture are coalesced into one LectureBot call.
+            groups: Dict[int, List[int]] = {}
+            for i, q in enumerate(questions):
+                groups.setdefault(q["lecture_number"], []).append(i)
+            span["attributes"]["lectures"] = sorted(groups)
+            tasks = {asyncio.ensure_future(self._ask_lecture_bot(lec_no, [questions[i]["question"] for i in indices],
+                                                                 [bool(questions[i].get("hard")) for i in indices])): indices
+                     for lec_no, indices in groups.items()}
+            def answered(task: asyncio.Task, indices: List[int]):
+                if not task.cancelled() and task.exception() is None:
+                    for i, answer in zip(indices, task.result()):
+                        on_specialist(questions[i]["lecture_number"], questions[i]["question"], answer)
+
+            if on_specialist is not None:
+                for task, indices in tasks.items():
+                    task.add_done_callback(lambda task, indices=indices: answered(task, indices))
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            span["attributes"]["timed_out"] = len(pending)
+            results = [""] * len(questions)
+            for task, indices in tasks.items():
+                for j, i in enumerate(indices):
+                    if task in pending:
+                        results[i] = "Error: no answer within the time budget.\n\n"
+                    elif (e := task.exception()) is not None:
+                        results[i] = f"Error: {e}\n\n"
+                    else:
+                        results[i] = f"From lecture {questions[i]['lecture_number']}:\n{task.result()[j]}\n\n"
+            self.internal_printer.received_answers_over_lectures(questions, results)
+            return results
+
+    def _describe_lectures(self, question: str, top_k: int) -> str:
+        # Only the top-k lectures ranked by the local index get full summaries;
+        # the rest are listed by title so that the coordinator can still pick them.
+        ranked = self.router.rank(question)
+        shortlist, others = ranked[:top_k], sorted(ranked[top_k:])
+        lecture_summaries = f"Ranked shortlist (most likely relevant first): {', '.join(map(str, shortlist))}\n\n"
+        for lec_no in shortlist:
+            lec_info = self.lecture_summaries[lec_no]
+            lecture_summaries += f"Lecture {lec_no}: {lec_info['title']}\n"
+            lecture_summaries += f"  Keywords: {', '.join(lec_info['keywords'])}\n"
+            lecture_summaries += f"  Brief: {lec_info['brief']}\n\n"
+        if others:
+            lecture_summaries += "Other lectures:\n"
+            for lec_no in others:
+                lecture_summaries += f"Lecture {lec_no}: {self.lecture_summaries[lec_no]['title']}\n"
+        return lecture_summaries
+
+    def answer_question(self, question: str, max_iterations: int, top_k: int = 6, time_budget: Optional[float] = None,
+                        history: Optional[List[Tuple[str, str]]] = None, on_text: Optional[Callable[[str], None]] = None,
+                        on_specialist: Optional[Callable[[int, str, str], None]] = None) -> str:
+        return Scheduler.run(self.answer_question_async(question, max_iterations, top_k, time_budget, history, on_text, on_specialist))
+
+    def stream_question(self, question: str, max_iterations: int, top_k: int = 6, time_budget: Optional[float] = None,
+                        history: Optional[List[Tuple[str, str]]] = None) -> Iterator[tuple]:
+        """
+        Yields ("specialist", lecture_number, question, answer), ("text", piece_of_final_answer) and ("retract",)
+        events as they happen, then ("answer", final_answer). A retract event discards the text events so far.
+        """
+        events = queue.Queue()
+        future = Scheduler.start(self.answer_question_async(
+            question, max_iterations, top_k, time_budget, history,
+            on_text=lambda text: events.put(("text", text) if text is not None else ("retract",)),
+            on_specialist=lambda lec_no, q, a: events.put(("specialist", lec_no, q, a))))
+        future.add_done_callback(lambda _: events.put(None))
+        try:
+            while (event := events.get()) is not None:
+                yield event
+            yield ("answer", future.result())
+        finally:
+            future.cancel()
 
-    def answer_question(self, question: str, max_iterations: int) -> str:
+    async def answer_question_async(self, question: str, max_iterations: int, top_k: int = 6, time_budget: Optional[float] = None,
+                                    history: Optional[List[Tuple[str, str]]] = None, on_text: Optional[Callable[[str], None]] = None,
+                                    on_specialist: Optional[Callable[[int, str, str], None]] = None) -> str:
+        """
+        time_budget: seconds to spend on gathering information. When it runs out, pending specialist
+        calls are abandoned and the final answer is forced from what has been gathered so far.
+        history: earlier (question, answer) pairs of the same conversation, oldest first.
+        on_text: called with each piece of the final answer as it is generated, and with None when the text
+        passed on so far is discarded, because the response it came from was unusable.
+        on_specialist: called with (lecture_number, question, answer) as each specialist answer arrives.
+        Callbacks are called on the scheduler loop, so they must not block.
+        """
+        with Tracer.span("question", question=question) as span:
+            # Follow-up questions depend on the conversation, so only standalone ones use the similar question cache.
+            # It is used from a worker thread, to keep its file writes and source hashing off the scheduler loop.
+            loop = asyncio.get_running_loop()
+            similar = await loop.run_in_executor(None, self.similar_cache.lookup, question, self._lecture_hash) \
+                if self.similar_cache and not history else None
+            if similar:
+                span["attributes"]["similarity"] = similar[0]
+                if similar[2]:
+                    if on_text is not None:
+                        on_text(similar[1]["answer"])
+                    return similar[1]["answer"]
+            speculation = self._speculate(question) if self.speculative else {}
+            span["attributes"]["speculative_lectures"] = sorted(speculation)
+            consulted = set()
+            try:
+                answer = await self._answer_question(question, max_iterations, top_k, time_budget, history, speculation,
+                                                     consulted, similar[1] if similar else None, on_text, on_specialist)
+            finally:
+                self._discard_speculation(speculation)
+            if self.similar_cache and not history and consulted and answer != self.FAILED_ANSWER:
+                await loop.run_in_executor(None, self.similar_cache.put, question, answer,
+                                           {lec_no: self._lecture_hash(lec_no) for lec_no in sorted(consulted)})
+            return answer
+
+    async def _answer_question(self, question: str, max_iterations: int, top_k: int, time_budget: Optional[float],
+                               history: Optional[List[Tuple[str, str]]], speculation: Dict[int, asyncio.Task],
+                               consulted: set, seed: Optional[dict], on_text: Optional[Callable[[str], None]],
+                               on_specialist: Optional[Callable[[int, str, str], None]]) -> str:
+        """consulted collects the valid lecture numbers asked; seed is a similar question answered before."""
         # Let the main AI decide to ask LectureBots questions on specific lectures,
         # until it is confident to generate a final answer.
         
         # Create lecture summaries for context
-        lecture_summaries = ""
-        for lec_no in sorted(self.lecture_summaries.keys()):
-            lec_info = self.lecture_summaries[lec_no]
-            lecture_summaries += f"Lecture {lec_no}: {lec_info['title']}\n"
-            lecture_summaries += f"  Keywords: {', '.join(lec_info['keywords'])}\n"
-            lecture_summaries += f"  Brief: {lec_info['brief']}\n\n"
+        lecture_summaries = self._describe_lectures(question, top_k)
         
         system_prompt = f"""You are an intelligent teaching assistant coordinator for an introductory C/C++ programming course. Your role is to help students by strategically gathering information from specific lectures to answer their questions comprehensively.
 
@@ -405,7 +2197,7 @@ You must respond in JSON format with one of two actions:
     "action": "ask_questions",
     "reasoning": "Brief explanation of why you're asking these questions",
     "questions": [
-        {{"lecture_number": N, "question": "Specific question about this lecture's content"}},
+        {{"lecture_number": N, "question": "Specific question about this lecture's content", "hard": false}},
         ...
     ]
 }}
@@ -419,32 +2211,58 @@ You must respond in JSON format with one of two actions:
 GUIDELINES:
 - Ask specific, targeted questions to relevant lectures
 - Don't ask too many questions at once (3-5 max per iteration)
+- Set "hard" to true only for questions that need careful reasoning over the lecture (subtle semantics, tracing code, comparing approaches); plain lookups are not hard
 - Build upon previous answers to ask follow-up questions if needed
 - Provide comprehensive final answers that synthesize information from multiple lectures when appropriate
 - If a topic spans multiple lectures, gather information from all relevant ones
 - Lecture slides may contain images and external links. Answers can include them using standard Markdown syntax "![]()" and "[]()" with appropriate paths/URLs. As a helpful teaching assistant, you can use these resources to enhance your explanations."""
 
-        prompt = f"""Student Question: {question}
+        prompt = ""
+        if history:
+            prompt += "Earlier in this conversation:\n\n"
+            prompt += "".join(f"Student: {q}\nAssistant: {a}\n\n" for q, a in history)
+        if seed:
+            prompt += f"""A similar question was answered before. Use its answer if it applies, but check it against the lectures and gather whatever is missing.
+
+Similar Question: {seed["question"]}
+Its Answer: {seed["answer"]}
+
+"""
+        prompt += f"""Student Question: {question}
 
 Please analyze this question and determine what information you need to gather from specific lectures to provide a comprehensive answer. Start by identifying which lectures are most likely to contain relevant information, then ask targeted questions to gather the details needed."""
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
-        for _ in range(max_iterations):
-            response_str = self.llm.invoke(messages, response_format={"type": "json_object"})
-            messages.append({"role": "assistant", "content": response_str})
-            try:
-                response = json.loads(response_str)
-            except json.JSONDecodeError as e:
-                messages.append({"role": "user", "content": f"The previous response was not valid JSON: {e}. Please make sure the response is in JSON format."})
-                continue
-            # We simply assume the response is valid hereafter
-            if response["action"] == "ask_questions":
-                results = self._process_lecture_questions(response["reasoning"], response["questions"], 8)
-                answers = "Answers:\n\n" + "".join(results)
+        context = CoordinatorContext(system_prompt, prompt, self.context_budget, self.compaction)
+        import openai
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        for iteration in range(max_iterations):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            with Tracer.span("coordinator_iteration", iteration=iteration) as span:
+                await context.compact()
+                context.new_round()
+                try:
+                    response_str = await self._ask_coordinator(context.messages(), deadline, on_text)
+                except (openai.OpenAIError, TimeoutError, asyncio.TimeoutError):
+                    break  # Out of time or retries: the final answer is forced from what has been gathered.
+                context.append({"role": "assistant", "content": response_str})
+                try:
+                    response = json.loads(response_str)
+                except json.JSONDecodeError as e:
+                    context.append({"role": "user", "content": f"The previous response was not valid JSON: {e}. Please make sure the response is in JSON format."})
+                    continue
+                # We simply assume the response is valid hereafter
+                span["attributes"]["action"] = response["action"]
+                if response["action"] == "ask_questions":
+                    picked = {q["lecture_number"] for q in response["questions"]}
+                    consulted.update(picked & self.lecture_summaries.keys())
+                    results, speculated = await asyncio.gather(
+                        self._process_lecture_questions(response["reasoning"], response["questions"], deadline, on_specialist),
+                        self._use_speculation(speculation, picked, question, deadline, on_specialist))
+                    context.add_answers(response["questions"], results)
+                    context.add_answers([q for q, _ in speculated], [result for _, result in speculated])
+                    answers = "Answers:\n\n" + "".join(results) + "".join(result for _, result in speculated)
                 
-                continue_prompt = f"""Based on the answers above, do you have enough information to provide a comprehensive final answer to the student's question? 
+                    continue_prompt = f"""Based on the answers above, do you have enough information to provide a comprehensive final answer to the student's question? 
 
 If YES: Provide your final answer using the "final_answer" action.
 If NO: Ask additional targeted questions to gather more specific information you need.
@@ -453,13 +2271,13 @@ Remember to synthesize information from multiple lectures when relevant and prov
 
 Student's question was: {question}
 """
-                messages.append({"role": "user", "content": answers + continue_prompt})
-            elif response["action"] == "final_answer":
-                return response["answer"]
-            else:
-                messages.append({"role": "user", "content": f"Unknown action '{response['action']}'. Please respond with either 'ask_questions' or 'final_answer'."})
+                    context.append({"role": "user", "content": answers + continue_prompt})
+                elif response["action"] == "final_answer":
+                    return response["answer"]
+                else:
+                    context.append({"role": "user", "content": f"Unknown action '{response['action']}'. Please respond with either 'ask_questions' or 'final_answer'."})
 
-        force_answer_prompt = """Maximum iterations reached. Please provide the best possible final answer based on the information gathered so far.
+        force_answer_prompt = """Maximum iterations or time budget reached. Please provide the best possible final answer based on the information gathered so far.
         Your response should still be in a valid JSON format with the action 'final_answer' and an 'answer' field. Example:
 
         ```json
@@ -469,29 +2287,370 @@ Student's question was: {question}
         }
         ```
         """
-        messages.append({"role": "user", "content": force_answer_prompt})
+        context.append({"role": "user", "content": force_answer_prompt})
         for _ in range(3):
             try:
-                return json.loads(self.llm.invoke(messages, response_format={"type": "json_object"}))["answer"]
-            except:
-                pass
-        return "Failed to generate a final answer after maximum attempts."
+                return json.loads(await self._ask_coordinator(context.messages(), None, on_text))["answer"]
+            except (json.JSONDecodeError, KeyError, TypeError):
+                pass  # Request errors are already retried by LLM; only retry malformed output here.
+            except (openai.OpenAIError, TimeoutError, asyncio.TimeoutError):
+                break  # Out of retries
+        return self.FAILED_ANSWER
+
+    async def _ask_coordinator(self, messages: List[Dict[str, str]], deadline: Optional[float],
+                               on_text: Optional[Callable[[str], None]]) -> str:
+        """Asks the models of the coordinator tier in turn, until one gives a well-formed response."""
+        models = LLM.tier_models("coordinator")
+        for level, model in enumerate(models):
+            if on_text is None:
+                response_str = await self.llm.ainvoke(messages, deadline, model=model, response_format={"type": "json_object"})
+            else:
+                # Only the "answer" field of a final answer is passed on, as it is generated. It is taken back
+                # unless the response turns out to be a well-formed final answer, which is the only kind used as is.
+                field = StreamedField("answer", on_text)
+                try:
+                    response_str = await self.llm.astream(messages, field, deadline, field.restart, model=model,
+                                                          response_format={"type": "json_object"})
+                except BaseException:
+                    field.retract()
+                    raise
+                if not self._is_well_formed(response_str) or json.loads(response_str)["action"] != "final_answer":
+                    field.retract()
+            if level == len(models) - 1 or self._is_well_formed(response_str):
+                return response_str
+
+    def _is_well_formed(self, response_str: str) -> bool:
+        try:
+            response = json.loads(response_str)
+        except json.JSONDecodeError:
+            return False
+        if not isinstance(response, dict):
+            return False
+        if response.get("action") == "final_answer":
+            return isinstance(response.get("answer"), str) and bool(response["answer"].strip())
+        if response.get("action") == "ask_questions":
+            questions = response.get("questions")
+            return isinstance(response.get("reasoning"), str) and isinstance(questions, list) and bool(questions) and \
+                all(isinstance(q, dict) and q.get("lecture_number") in self.lecture_summaries and isinstance(q.get("question"), str)
+                    for q in questions)
+        return False
+
+
+class Session:
+    """A conversation with one student. Its questions are answered one at a time."""
+    max_turns: int = 5
+
+    def __init__(self):
+        self.history: List[Tuple[str, str]] = []
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def ask(self, bot: SlidesBot, question: str, **options) -> str:
+        with self.lock:
+            self.last_used = time.monotonic()
+            answer = bot.answer_question(question, history=self.history[-self.max_turns:], **options)
+            self.history.append((question, answer))
+            self.last_used = time.monotonic()
+            return answer
+
+    def stream(self, bot: SlidesBot, question: str, **options) -> Iterator[tuple]:
+        """Like ask, but yields the events of SlidesBot.stream_question."""
+        with self.lock:
+            self.last_used = time.monotonic()
+            for event in bot.stream_question(question, history=self.history[-self.max_turns:], **options):
+                if event[0] == "answer":
+                    self.history.append((question, event[1]))
+                yield event
+            self.last_used = time.monotonic()
+
+
+class SessionStore:
+    def __init__(self, max_sessions: int = 1000, max_idle: float = 3600):
+        self.sessions: Dict[str, Session] = {}
+        self.max_sessions = max_sessions
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+
+    def get(self, session_id: Optional[str]) -> Tuple[str, Session]:
+        """Returns the session with the given id, creating it (with a new id if none is given) if needed."""
+        with self.lock:
+            now = time.monotonic()
+            for sid in [sid for sid, s in self.sessions.items() if now - s.last_used > self.max_idle]:
+                del self.sessions[sid]
+            session_id = session_id or uuid.uuid4().hex
+            if session_id not in self.sessions:
+                if len(self.sessions) >= self.max_sessions:
+                    del self.sessions[min(self.sessions, key=lambda sid: self.sessions[sid].last_used)]
+                self.sessions[session_id] = Session()
+            return session_id, self.sessions[session_id]
+
+    def drop(self, session_id: str):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+
+class SlidesServer(ThreadingHTTPServer):
+    """
+    Keeps one warm SlidesBot and serves questions over HTTP. Each request is handled on its own thread,
+    and all of them share the scheduler's cap on LLM requests.
+
+    POST /ask    {"question": "...", "session": "<optional id>"}  ->  {"session": "<id>", "answer": "...", "stats": {...}}
+    POST /ask    {"question": "...", "session": "<optional id>", "stream": true}
+                 ->  JSON lines, as they happen: {"type": "specialist", "lecture_number": N, "question": "...", "answer": "..."},
+                     {"type": "text", "text": "<piece of the final answer>"}, {"type": "retract"} when the text so far
+                     is discarded, and finally {"type": "answer", "session": "<id>", ...}
+    POST /reset  {"session": "<id>"}                              ->  {"session": "<id>"}
+    GET  /health                                                  ->  {"status": "ok", "sessions": N, "bot": {...}}
+    """
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], bot: SlidesBot, **options):
+        super().__init__(address, SlidesRequestHandler)
+        self.bot = bot
+        self.options = options
+        self.sessions = SessionStore()
+
+
+class SlidesRequestHandler(BaseHTTPRequestHandler):
+    server: SlidesServer
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, session_id: str, session: Session, question: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.end_headers()
+
+        def send(event: dict):
+            self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            with Tracer.collect() as report:
+                for event in session.stream(self.server.bot, question, **self.server.options):
+                    if event[0] == "specialist":
+                        send({"type": "specialist", "lecture_number": event[1], "question": event[2], "answer": event[3]})
+                    elif event[0] == "text":
+                        send({"type": "text", "text": event[1]})
+                    elif event[0] == "retract":
+                        send({"type": "retract"})
+                    else:
+                        answer = event[1]
+            send({"type": "answer", "session": session_id, "answer": answer, "stats": report.to_dict()})
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client went away; the question is abandoned.
+        except Exception as e:
+            send({"type": "error", "session": session_id, "error": str(e)})
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._reply(200, {"status": "ok", "sessions": len(self.server.sessions.sessions), "bot": self.server.bot.stats()})
+        else:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except json.JSONDecodeError as e:
+            return self._reply(400, {"error": f"Invalid JSON: {e}"})
+        if not isinstance(request, dict):
+            return self._reply(400, {"error": "The request body must be a JSON object."})
+        if self.path == "/ask":
+            if not isinstance(question := request.get("question"), str) or not question.strip():
+                return self._reply(400, {"error": "Missing 'question'."})
+            session_id, session = self.server.sessions.get(request.get("session"))
+            if request.get("stream"):
+                return self._stream(session_id, session, question)
+            try:
+                with Tracer.collect() as report:
+                    answer = session.ask(self.server.bot, question, **self.server.options)
+            except Exception as e:
+                return self._reply(500, {"session": session_id, "error": str(e)})
+            self._reply(200, {"session": session_id, "answer": answer, "stats": report.to_dict()})
+        elif self.path == "/reset":
+            if session_id := request.get("session"):
+                self.server.sessions.drop(session_id)
+            self._reply(200, {"session": session_id})
+        else:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+
+
+class FinalAnswerPrinter:
+    """
+    Prints a final answer. Passed as on_text, it prints the answer as it is generated, and marks the text
+    printed so far as discarded when it is retracted.
+    """
+
+    def __init__(self):
+        self.streamed = False
+
+    def __call__(self, text: Optional[str]):
+        if text is None:
+            if self.streamed:
+                self.streamed = False
+                print("\n\n\033[2m(The answer above was discarded.)\033[0m")
+            return
+        if not self.streamed:
+            self.streamed = True
+            print(f"\n\033[1mFinal answer\033[0m:\n")
+        print(text, end="", flush=True)
+
+    def finish(self, answer: str):
+        if self.streamed:
+            print()
+        else:
+            print(f"\n\033[1mFinal answer\033[0m:\n\n{answer}")
+
+
+def interactive(bot: SlidesBot, stream: bool = True, **options):
+    print("Entering interactive mode. Type 'exit' to quit, 'reset' to start a new conversation.")
+    session = Session()
+    while True:
+        try:
+            question = input("\n\033[1mQuestion\033[0m: ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        if question == "exit":
+            break
+        if question == "reset":
+            session = Session()
+            continue
+        if question:
+            printer = FinalAnswerPrinter()
+            printer.finish(session.ask(bot, question, on_text=printer if stream else None, **options))
+
+
+async def run_batch(bot: SlidesBot, input_path: Path, output_path: Path, concurrency: int, **options):
+    """
+    Answers the questions of a JSONL file, one {"id": ..., "question": ...} per line ("id" defaults to the
+    question, so that adding or removing lines does not change it), and appends {"id", "question", "answer"
+    or "error", "stats"} lines to the output file as they finish. Questions that already have an answer in
+    the output file are skipped, so a crashed run resumes where it stopped. Raises ValueError, before any
+    question is asked, if a line is not such an object or if two lines have the same id (such as the same
+    question twice without ids). Sessions share the LLM scheduler, the answer cache, and the LectureBot
+    calls in flight, so identical specialist questions across sessions are asked only once.
+    """
+    items, ids = [], set()
+    with open(input_path, 'r', encoding='utf-8') as file:
+        for line_no, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{input_path}:{line_no}: invalid JSON: {e}")
+            if not isinstance(item, dict) or not isinstance(item.get("question"), str) or not item["question"].strip() \
+                    or not isinstance(item.get("id", 0), (str, int)):
+                raise ValueError(f"{input_path}:{line_no}: expected an object with a 'question' string and an optional string or integer 'id'.")
+            item.setdefault("id", item["question"])
+            if item["id"] in ids:
+                raise ValueError(f"{input_path}:{line_no}: duplicate id {item['id']!r}.")
+            ids.add(item["id"])
+            items.append(item)
+    done = set()
+    if output_path.exists():
+        with open(output_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line cut off by a crash
+                if "answer" in record:
+                    done.add(record["id"])
+    todo = [item for item in items if item["id"] not in done]
+    print(f"{len(items)} questions, {len(items) - len(todo)} already answered.", file=sys.stderr)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    output = open(output_path, 'a', encoding='utf-8')
+    finished = 0
+
+    async def answer(item: dict):
+        nonlocal finished
+        async with semaphore:
+            record = {"id": item["id"], "question": item["question"]}
+            with Tracer.collect() as report:
+                try:
+                    record["answer"] = await bot.answer_question_async(item["question"], **options)
+                except Exception as e:
+                    record["error"] = repr(e)
+            record["stats"] = report.to_dict()
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            finished += 1
+            print(f"[{finished}/{len(todo)}] {item['id']}: {'ok' if 'answer' in record else record['error']}", file=sys.stderr)
+
+    try:
+        await asyncio.gather(*(answer(item) for item in todo))
+    finally:
+        output.close()
 
 
 def main():
     args = parse_arguments()
+    Scheduler.max_in_flight = args.max_in_flight
+    LLM.timeout = args.request_timeout
+    LLM.hedge = args.hedge
+    LLM.tiers = {role: getattr(args, f"{role}_tier") for role in LLM.tiers}
+    if args.trace_file:
+        Tracer.sinks.append(JsonlExporter(Path(args.trace_file)))
     if args.config_llm:
         LLM.init_from_config_file(Path(args.config_llm))
     else:
         LLM.init_gkxx_deepseek()
     bot = SlidesBot(summary_path=Path(__file__).parent / "summary.json",
-                    readme_path=Path(__file__).parent / "README.md")
+                    readme_path=Path(__file__).parent / "README.md",
+                    answer_cache_path=None if args.no_answer_cache else Path(args.answer_cache),
+                    snapshot_path=None if args.no_snapshot else Path(args.snapshot))
+    bot.internal_printer.enabled = not (args.quiet or args.serve or args.batch)
+    bot.context_budget = args.context_budget or None
+    bot.compaction = args.compaction
+    bot.speculative = args.speculative
+    bot.speculative_lectures = args.speculative_lectures
+    bot.speculative_budget = args.speculative_budget
+    if not args.no_similar_cache:
+        try:
+            bot.similar_cache = SimilarQuestionCache(Path(args.similar_cache), threshold=args.similar_threshold)
+        except ImportError:
+            print("Warning: NumPy is not installed. The similar question cache is disabled.", file=sys.stderr)
+    options = dict(max_iterations=args.max_iterations, top_k=args.top_k, time_budget=args.time_budget)
     if args.question is not None:
-        answer = bot.answer_question(args.question, args.max_iterations)
-        print(f"\n\033[1mFinal answer\033[0m:\n\n{answer}")
+        printer = FinalAnswerPrinter()
+        with Tracer.collect() as report:
+            answer = bot.answer_question(args.question, on_text=printer if not args.no_stream else None, **options)
+        printer.finish(answer)
+        if args.report:
+            print(f"\n\033[1mReport\033[0m:\n")
+            json.dump({**report.to_dict(), "bot": bot.stats()}, sys.stdout, indent=2)
+            print()
+    elif args.batch:
+        if not args.batch_output:
+            raise SystemExit("--batch requires --batch-output.")
+        try:
+            Scheduler.run(run_batch(bot, Path(args.batch), Path(args.batch_output), args.batch_concurrency, **options))
+        except ValueError as e:
+            raise SystemExit(str(e))
+    elif args.serve:
+        LLM.warm_up()
+        bot.preload()
+        server = SlidesServer((args.host, args.port), bot, **options)
+        print(f"Serving on http://{args.host}:{args.port}. Press Ctrl+C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
     else:
-        print("Entering interactive mode. Type 'exit' to quit.")
-        raise NotImplementedError("Interactive mode is not implemented yet.")
+        LLM.warm_up()  # While the student types the first question
+        bot.preload()
+        interactive(bot, stream=not args.no_stream, **options)
 
 
 if __name__ == "__main__":